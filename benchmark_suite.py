@@ -0,0 +1,448 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+from multiprocessing import get_context
+
+import numpy as np
+
+import logging
+# change logging level from INFO to DEBUG to print debugging logs
+logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(funcName)s - %(lineno)d - %(message)s')
+
+# the generated maps and catalogs are kept in this directory, and reused by the next runs
+data_dir = os.path.join(tempfile.gettempdir(), "redmart_benchmark")
+
+# the stored baseline: the time (seconds) of each engine on each case, see --update-baseline
+baseline_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# each engine is timed time_runs times and the fastest run is compared with the baseline (the other jobs of the
+# machine only slow a run down); it fails if it takes longer than the baseline * time_tolerance + time_slack (s)
+time_runs = 3
+time_tolerance = 1.5
+time_slack = 0.1
+
+# a run is stopped, and fails, after run_timeout seconds
+run_timeout = 300
+
+# all the generators are seeded, so the same case is always the same map or catalog
+seed = 2015
+
+# the benchmark cases of each suite:
+#   ski:   (name, generator, row, column, engines)
+#   prize: (name, volume distribution, number of products, reduce the candidates, engines)
+ski_engines = ["recursive", "iterative", "numpy", "tiled", "mmap"]
+prize_engines = ["table", "rolling", "numpy", "compressed", "hirschberg", "parallel", "bnb", "pareto", "anytime"]
+suites = {
+    "quick": {
+        "ski": [
+            ("random_300", "random", 300, 300, ski_engines + ["edits"]),
+            ("spiral_336", "spiral", 336, 336, ski_engines),
+            ("plateau_500", "plateau", 500, 500, ski_engines + ["edits"]),
+        ],
+        "prize": [
+            ("uniform_20000", "uniform", 20000, True, prize_engines + ["updates"]),
+            ("small_5000", "small", 5000, False, ["numpy", "compressed", "hirschberg", "parallel"]),
+            ("equal_2000", "equal", 2000, True, prize_engines[1:] + ["updates"]),
+        ],
+    },
+    "full": {
+        "ski": [
+            ("random_1000", "random", 1000, 1000, ski_engines),
+            ("spiral_1000", "spiral", 1000, 1000, ski_engines),
+            ("plateau_2000", "plateau", 2000, 2000, ski_engines[1:]),
+            ("random_5000", "random", 5000, 5000, ["numpy", "tiled", "mmap"]),
+        ],
+        "prize": [
+            ("uniform_1000000", "uniform", 1000000, True, ["numpy", "compressed", "bnb", "anytime"]),
+            ("small_20000", "small", 20000, False, ["numpy", "compressed", "hirschberg", "parallel"]),
+            ("large_20000", "large", 20000, False, ["numpy", "compressed", "hirschberg", "parallel"]),
+        ],
+    },
+}
+
+# the approximate engines only find a tote not more valuable than the exact engines
+approximate_engines = {"anytime"}
+
+# the engines expected to fail on the maps of a generator, with the error they should raise
+# (the paths of the spirals are deeper than the recursion limit of Python)
+failing_engines = {"spiral": {"recursive": "RecursionError"}}
+
+# the checks of the incremental updates, run as engines of the cases:
+#   "edits"   - rounds of random height edits on a solved map, each result of update_heights() is checked
+#               against a fresh solve (edit_rounds x edits_per_round edits)
+#   "updates" - rounds of random changes to a Catalog, each best tote is checked against a fresh solve
+#               (update_rounds x updates_per_round changes)
+# all the changes are undone at the end, so the results must be the same as the other engines
+edit_rounds, edits_per_round = 10, 5
+update_rounds, updates_per_round = 10, 10
+
+
+def random_map(row, column, rng):
+    # heights uniformly distributed between 0 and 1500
+    return rng.integers(0, 1501, size=(row, column))
+
+
+def spiral_map(row, column, rng):
+    # tiles of 56 x 56 Areas, each one a spiral corridor (1 Area wide) going down by 1 per Area from 1499 at
+    # the outside to 0 near the centre, between walls of height 1500 (incl. the last row and column of the
+    # tile, between the tiles). The only lower neighbour of each Area on the corridor is the next one, so the
+    # longest path (1501 Areas, from a wall) has no shortcut: a depth-first search goes 1500 Areas deep.
+    size, length, wall = 55, 1500, 1500
+    spiral = np.full((size + 1, size + 1), wall, dtype=np.int64)
+    x, y, dx, dy = 0, 0, 0, 1
+    for k in range(length):
+        spiral[x, y] = length - 1 - k
+        # keep going straight unless the corridor would touch itself (one Area of wall between the arms)
+        for turn in range(2):
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < size and 0 <= ny < size and spiral[nx, ny] == wall and \
+                    not (0 <= nx + dx < size and 0 <= ny + dy < size and spiral[nx + dx, ny + dy] < wall):
+                break
+            dx, dy = dy, -dx
+        x, y = nx, ny
+    tiles = np.tile(spiral, ((row + size) // (size + 1), (column + size) // (size + 1)))
+    return tiles[:row, :column]
+
+
+def plateau_map(row, column, rng):
+    # flat blocks of up to 50 x 50 Areas with a few different heights, and some random Areas on them
+    block = 50
+    levels = rng.integers(0, 8, size=((row + block - 1) // block, (column + block - 1) // block)) * 200
+    heights = np.kron(levels, np.ones((block, block), dtype=np.int64))[:row, :column]
+    noise = rng.random((row, column)) < 0.01
+    heights[noise] = rng.integers(0, 1501, size=int(noise.sum()))
+    return heights
+
+
+def catalog(distribution, num_products, rng):
+    # the columns of a product catalog (ID, price, length, width, height, weight), with the dimensions of:
+    #   "uniform" - 1 to 60 cm, most products don't fit into the tote
+    #   "small"   - 1 to 15 cm, many products in a tote
+    #   "large"   - 15 to 45 cm, a few products in a tote
+    #   "equal"   - all 10 x 10 x 10 cm, with a few different prices and weights (many ties)
+    low, high = {"uniform": (1, 60), "small": (1, 15), "large": (15, 45), "equal": (10, 10)}[distribution]
+    dimensions = rng.integers(low, high + 1, size=(num_products, 3))
+    if distribution == "equal":
+        prices = rng.integers(1, 5, size=num_products) * 100
+        weights = rng.integers(1, 4, size=num_products) * 100
+    else:
+        prices = (dimensions.prod(axis=1) * rng.uniform(0.2, 2.0, size=num_products)).astype(np.int64) + 1
+        weights = rng.integers(10, 5000, size=num_products)
+    ids = rng.permutation(num_products * 3)[:num_products] + 1
+    return np.column_stack((ids, prices, dimensions, weights))
+
+
+def generate_map(name, generator, row, column):
+    # write the map in the input format of ski.py (the 1st line is the size), unless it already exists
+    file_name = os.path.join(data_dir, "ski_{}_{}.txt".format(name, seed))
+    if not os.path.exists(file_name):
+        rng = np.random.default_rng([seed, row, column])
+        heights = {"random": random_map, "spiral": spiral_map, "plateau": plateau_map}[generator](row, column, rng)
+        with open(file_name + ".tmp", "w") as file:
+            file.write("{} {}\n".format(row, column))
+            np.savetxt(file, heights, fmt="%d")
+        os.replace(file_name + ".tmp", file_name)
+    return file_name
+
+
+def generate_catalog(name, distribution, num_products):
+    # write the catalog in the input format of prize.py (no header), unless it already exists
+    file_name = os.path.join(data_dir, "prize_{}_{}.csv".format(name, seed))
+    if not os.path.exists(file_name):
+        rng = np.random.default_rng([seed, num_products])
+        with open(file_name + ".tmp", "w") as file:
+            np.savetxt(file, catalog(distribution, num_products, rng), fmt="%d", delimiter=",")
+        os.replace(file_name + ".tmp", file_name)
+    return file_name
+
+
+def measure(prepare, solve):
+    # run an engine on the same input: timed time_runs times, then traced by tracemalloc (which slows it down,
+    # the engines in pure Python the most) for the peak memory it allocates, numpy arrays included
+    # returns the results of the 1st run, the time of the fastest run and the peak memory (MB)
+    times = []
+    for run in range(time_runs):
+        data = prepare()
+        start = time.perf_counter()
+        run_result = solve(data)
+        times.append(time.perf_counter() - start)
+        if run == 0:
+            result = run_result
+    elapsed = min(times)
+
+    data = prepare()
+    tracemalloc.start()
+    solve(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, elapsed, peak / (1 << 20)
+
+
+def check_edits(ski, ski_map):
+    # the "edits" engine: solve the map, then edit it in rounds and check update_heights() against a fresh solve
+    rng = np.random.default_rng([seed, ski_map.row, ski_map.column])
+    original = ski_map.heights.copy()
+    ski.solve_numpy(ski_map)
+
+    for k in range(edit_rounds):
+        cells = rng.choice(ski_map.size, size=min(edits_per_round, ski_map.size), replace=False)
+        heights = rng.integers(0, ski.max_height + 1, size=cells.size)
+        ski.update_heights(ski_map, [(int(i) // ski_map.column, int(i) % ski_map.column, int(height))
+                                     for i, height in zip(cells, heights)])
+
+        fresh = ski.SkiMap(ski_map.heights.reshape(ski_map.row, ski_map.column))
+        ski.solve_numpy(fresh)
+        for name in ("path_length", "bottom_height", "successor"):
+            if not np.array_equal(getattr(ski_map, name), getattr(fresh, name)):
+                raise Exception("round {} - {} of update_heights() differs from a fresh solve".format(k + 1, name))
+
+    # edit all the heights back
+    cells = np.flatnonzero(ski_map.heights != original)
+    ski.update_heights(ski_map, [(int(i) // ski_map.column, int(i) % ski_map.column, int(original[i]))
+                                 for i in cells])
+
+
+def check_updates(prize, products):
+    # the "updates" engine: change a Catalog in rounds and check its best tote against a fresh solve
+    rng = np.random.default_rng([seed, len(products)])
+    catalog = prize.Catalog(products, engine_name="numpy")
+    original = dict(catalog.by_id)
+    next_id = max(original, default=0) + 1
+    catalog.best_tote()
+
+    for k in range(update_rounds):
+        for change in range(updates_per_round):
+            ids = list(catalog.by_id)
+            action = rng.random()
+            if action < 0.3 or not ids:
+                length, width, height = (int(d) for d in rng.integers(1, 31, size=3))
+                catalog.add_product(next_id, int(rng.integers(1, 5000)), length, width, height,
+                                    int(rng.integers(10, 5000)))
+                next_id += 1
+            elif action < 0.5:
+                catalog.remove_product(ids[int(rng.integers(len(ids)))])
+            else:
+                # re-price a product in the tote (half of the time) or any product, up or down
+                in_tote = [product.p_id for product in catalog.best_tote().items]
+                p_id = in_tote[int(rng.integers(len(in_tote)))] if in_tote and rng.random() < 0.5 \
+                    else ids[int(rng.integers(len(ids)))]
+                catalog.update_price(p_id, max(1, catalog.by_id[p_id].value + int(rng.integers(-500, 501))))
+
+        tote = catalog.best_tote()
+        candidates = sorted(catalog.by_id.values(), reverse=True)
+        fresh = prize.find_best_tote(candidates, min(product.volume for product in candidates), engine_name="numpy") \
+            if candidates else prize.Basket(catalog.capacity, "TOTE")
+        if (tote.value, tote.weight) != (fresh.value, fresh.weight):
+            raise Exception("round {} - best tote of the Catalog (value {}, weight {}) differs from a fresh solve "
+                            "(value {}, weight {})".format(k + 1, tote.value, tote.weight, fresh.value, fresh.weight))
+
+    # undo all the changes
+    for p_id in list(catalog.by_id):
+        if p_id not in original:
+            catalog.remove_product(p_id)
+    for p_id, product in original.items():
+        if p_id not in catalog.by_id:
+            catalog.add_product(p_id, product.value, *product.dimensions, product.weight)
+        elif catalog.by_id[p_id].value != product.value:
+            catalog.update_price(p_id, product.value)
+
+    return catalog.best_tote()
+
+
+def run_ski(file_name, engine_name):
+    # solve a map with an engine, run in a new process
+    # returns the results (max length, drop and a digest of all the path lengths and bottom heights),
+    # the time spent and the peak memory (MB) of the engine
+    import ski
+    logging.getLogger().setLevel(logging.WARNING)
+    work_dirs = []
+
+    def prepare():
+        if engine_name == "mmap":
+            work_dirs.append(tempfile.mkdtemp(dir=data_dir))
+            return ski.prepare_map_out_of_core(file_name, work_dirs[-1])
+        return ski.prepare_map(file_name)
+
+    def solve(ski_map):
+        if engine_name == "mmap":
+            ski.solve_out_of_core(ski_map, work_dirs[-1])
+        elif engine_name == "tiled":
+            ski.solve_tiled(ski_map, 2, 200)
+        elif engine_name == "edits":
+            check_edits(ski, ski_map)
+        else:
+            ski.solvers[engine_name](ski_map)
+        return ski_map
+
+    ski_map, elapsed, memory = measure(prepare, solve)
+
+    max_length, max_drop = ski.find_max_path(ski_map)
+    digest = hashlib.sha1(np.asarray(ski_map.path_length).tobytes() +
+                          np.asarray(ski_map.bottom_height).tobytes()).hexdigest()[:12]
+    del ski_map
+    for work_dir in work_dirs:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return [max_length, max_drop, digest], elapsed, memory
+
+
+def run_prize(file_name, engine_name, b_reduce):
+    # find the best tote with an engine, run in a new process
+    # returns the results (total value and weight), the time spent and the peak memory (MB) of the engine
+    import prize
+    logging.getLogger().setLevel(logging.WARNING)
+
+    prize.b_reduce = b_reduce
+    products, min_volume = prize.process_input(file_name)
+
+    def solve(products):
+        if engine_name == "updates":
+            return check_updates(prize, products)
+        return prize.find_best_tote(products, min_volume, engine_name=engine_name, workers=2, budget=0.5)
+
+    tote, elapsed, memory = measure(lambda: products, solve)
+
+    return [tote.value, tote.weight], elapsed, memory
+
+
+def run_and_send(connection, function, args):
+    # run a function in the new process, and send back its results or its error
+    try:
+        connection.send((True, function(*args)))
+    except Exception as error:
+        connection.send((False, "{}: {}".format(type(error).__name__, error)))
+    connection.close()
+
+
+def run_in_new_process(function, *args):
+    # each run gets a fresh process, so the engines don't share any state (e.g. memory or caches)
+    # (not a Pool, as the parallel engines start processes of their own)
+    context = get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_and_send, args=(sender, function, args))
+    process.start()
+    sender.close()
+
+    try:
+        if not receiver.poll(run_timeout):
+            raise Exception("stopped after {} s".format(run_timeout))
+        b_success, result = receiver.recv()
+    except EOFError:
+        raise Exception("process exited with code {}".format(process.join() or process.exitcode))
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+    if not b_success:
+        raise Exception(result)
+    return result
+
+
+def run_suite(suite_name, puzzles):
+    # run all the cases of a suite, returns the rows of the report and the failures
+    os.makedirs(data_dir, exist_ok=True)
+    rows, failures = [], []
+
+    for puzzle in puzzles:
+        for case in suites[suite_name][puzzle]:
+            if puzzle == "ski":
+                name, generator, row, column, engines = case
+                file_name = generate_map(name, generator, row, column)
+            else:
+                name, distribution, num_products, b_reduce, engines = case
+                file_name = generate_catalog(name, distribution, num_products)
+                generator = distribution
+            expected_errors = failing_engines.get(generator, {})
+
+            reference = None
+            for engine_name in engines:
+                key = "{}/{}/{}".format(puzzle, name, engine_name)
+                try:
+                    if puzzle == "ski":
+                        result, elapsed, memory = run_in_new_process(run_ski, file_name, engine_name)
+                    else:
+                        result, elapsed, memory = run_in_new_process(run_prize, file_name, engine_name, b_reduce)
+                except Exception as error:
+                    rows.append([key, "error: {}".format(error), None, None])
+                    if engine_name in expected_errors and str(error).startswith(expected_errors[engine_name]):
+                        logging.info("{} - failed as expected - {}".format(key, error))
+                    else:
+                        failures.append("{} - {}".format(key, error))
+                    continue
+
+                rows.append([key, result, elapsed, memory])
+                logging.info("{} - {} - {:.3f} s, {:.1f} MB".format(key, result, elapsed, memory))
+                if engine_name in expected_errors:
+                    failures.append("{} - should have failed with {}".format(key, expected_errors[engine_name]))
+                    continue
+
+                if engine_name in approximate_engines:
+                    continue
+                if reference is None:
+                    reference = (engine_name, result)
+                elif result != reference[1]:
+                    failures.append("{} - results {} differ from {} ({})".
+                                    format(key, result, reference[0], reference[1]))
+
+            # the approximate engines can't beat the exact engines
+            for row in rows:
+                key, result = row[0], row[1]
+                if key.startswith("{}/{}/".format(puzzle, name)) and key.split("/")[-1] in approximate_engines and \
+                        isinstance(result, list) and reference is not None and result[0] > reference[1][0]:
+                    failures.append("{} - value {} is higher than {} ({})".
+                                    format(key, result[0], reference[0], reference[1][0]))
+
+    return rows, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engines of ski.py and prize.py on generated inputs.")
+    parser.add_argument("--suite", choices=sorted(suites), default="quick", help="the cases to run")
+    parser.add_argument("--puzzle", choices=["ski", "prize"], action="append",
+                        help="only run the cases of a puzzle (repeatable, default: both)")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the times of this run as the new baseline of the suite")
+    args = parser.parse_args()
+
+    rows, failures = run_suite(args.suite, args.puzzle or ["ski", "prize"])
+
+    baselines = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as file:
+            baselines = json.load(file)
+    baseline = baselines.get(args.suite, {})
+
+    print("{:<36} {:<34} {:>9} {:>9} {:>9}".format("case", "results", "time (s)", "baseline", "peak (MB)"))
+    for key, result, elapsed, memory in rows:
+        if elapsed is None:
+            print("{:<36} {}".format(key, result))
+            continue
+        print("{:<36} {:<34} {:>9.3f} {:>9} {:>9.1f}".
+              format(key, str(result), elapsed, "{:.3f}".format(baseline[key]) if key in baseline else "-", memory))
+
+        if not args.update_baseline and key in baseline and elapsed > baseline[key] * time_tolerance + time_slack:
+            failures.append("{} - {:.3f} s is slower than the baseline {:.3f} s".format(key, elapsed, baseline[key]))
+
+    if args.update_baseline:
+        baseline.update({key: round(elapsed, 3) for key, result, elapsed, memory in rows if elapsed is not None})
+        baselines[args.suite] = baseline
+        with open(baseline_file, "w") as file:
+            json.dump(baselines, file, indent=2, sort_keys=True)
+            file.write("\n")
+        logging.info("baseline of suite '{}' saved to '{}'".format(args.suite, baseline_file))
+
+    for failure in failures:
+        logging.error(failure)
+    if failures:
+        raise Exception("Benchmark failed: {} failures".format(len(failures)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,20 @@
+import argparse
+import numpy as np
 import pandas as pd
 import csv
+import json
+import math
+import os
+import time
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from array import array
 from enum import IntEnum
+from functools import lru_cache, reduce
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from multiprocessing import Barrier, Process
 
 import logging
 # change logging level from INFO to DEBUG to print debugging logs
@@ -19,19 +33,65 @@ class Idx(IntEnum):
 
 
 # The tote’s usable space is 45 centimeters long, 30 wide and 35 high
+tote_dimensions = (45, 30, 35)
 tote_volume = 45 * 30 * 35  # 47250 cm3
 
+# the carrier weight limit of a tote (gram), set to None for no limit
+# only the "pareto" engine supports the limit, it's used whenever the limit is set
+tote_max_weight = None
+
 # To control the number of rows to read from the input file (for debugging use)
 num_rows = None  # set to None to read the whole file
 
+# the input file is read in chunks of rows, so only the candidate products of the file are kept in memory
+chunk_rows = 1 << 20  # set to None to read the whole file at once
+
+# keep the sorted candidate products in a binary cache file next to the input file (e.g. "products.csv.npz")
+b_cache = False
+
+# the engine used to find the best products for the tote:
+#   "table"   - a table of BestStates for all the products and capacities, walked back to find the products
+#   "rolling" - only keeps one row of states in typed arrays and records the decisions in a bitset
+#   "numpy"   - same as "rolling", but each row is updated at once with numpy arrays
+#   "bnb"     - branch and bound in the order of unit price, pruned by the LP (fractional) upper bounds
+#   "compressed" - same as "numpy", on a shorter capacity axis: GCD of volumes, and sparse states while cheaper
+#   "hirschberg" - same as "numpy", but only keeps log2(n) rows of states, splitting the products in halves
+#   "parallel" - same as "numpy", but the capacity axis is split across worker processes on shared memory
+#   "anytime" - greedy fill, then improved within a time budget (pair swaps, FPTAS), with an upper bound
+#   "pareto"  - sparse states (volume, weight, value), only keeping the Pareto-optimal ones (weight limit)
+engine = "compressed"
+
+# number of worker processes of the "parallel" engine, None for the number of CPU cores
+num_workers = None
+
+# time budget (seconds) of the "anytime" engine, which returns the best tote found within the budget
+anytime_budget = 0.5
+
+# the service mode (see ToteService): max number of answers kept in the LRU cache
+service_cache_size = 256
+
+# reduce the candidate products before solving, without changing the results (see reduce_candidates())
+b_reduce = True
+
 
 class Product:
     def __init__(self, record=None):
-        self.p_id = int(record.iloc[Idx.p_id])         # product id
-        self.value = int(record.iloc[Idx.price])       # price (cent)
-        self.weight = int(record.iloc[Idx.weight])     # weight (g)
-        self.volume = int(record.iloc[Idx.volume])     # volume (cm3)
-        self.unit_price = record.iloc[Idx.unit_price]  # price per cubic centimeter = price/volume (cent/cm3)
+        # record: the fields of a product, indexed by Idx
+        self.p_id = int(record[Idx.p_id])         # product id
+        self.value = int(record[Idx.price])       # price (cent)
+        self.weight = int(record[Idx.weight])     # weight (g)
+        self.volume = int(record[Idx.volume])     # volume (cm3)
+        self.unit_price = record[Idx.unit_price]  # price per cubic centimeter = price/volume (cent/cm3)
+
+        # length, width and height (cm), sorted in ascending order
+        self.dimensions = tuple(sorted(int(record[idx]) for idx in (Idx.length, Idx.width, Idx.height)))
+
+    def fits(self, tote):
+        # whether the product can fit into a tote of dimensions (length, width, height) individually
+        # Assume that the orientation of a product doesn't matter
+        # (i.e. no request to place the product upright always).
+        # For simplicity, only consider the potential rotation of the product be 90, 180, 270 degrees.
+        return all(d <= t for d, t in zip(self.dimensions, sorted(tote)))
 
     def __str__(self):
         return "Product ID: {} - $={}, Weight={}, Volume={}, Unit$={}".\
@@ -134,59 +194,189 @@ class Basket:
             print("{} - {}".format(i + 1, self.items[i]))
 
 
-def process_input(csv_file_name):
+def process_input(csv_file_name, b_cache=False, totes=(tote_dimensions,), b_filter=False):
+    # b_cache: keep the sorted candidate products in a binary file next to the input file (e.g. "products.csv.npz"),
+    # so the next run on the same (i.e. same size and modification time) input file skips the processing
+    # totes: the dimensions of the totes, a candidate product fits into at least one of them
+    # b_filter: drop the dominated products while reading the input file (a single tote without weight limit)
+    if b_filter and len(totes) != 1:
+        raise Exception("Dominated products can only be filtered for a single tote")
+
+    cache_name = csv_file_name + ".npz"
+    stat = os.stat(csv_file_name)
+    key = np.array([stat.st_size, stat.st_mtime_ns, -1 if num_rows is None else num_rows, int(b_filter)] +
+                   [d for tote in totes for d in tote], dtype=np.int64)
+
+    columns = None
+    if b_cache and os.path.exists(cache_name):
+        with np.load(cache_name) as cache:
+            if np.array_equal(cache["key"], key):
+                columns = [cache[idx.name] for idx in Idx]
+                min_volume = int(cache["min_volume"])
+                logging.info("Loaded candidate products from cache: '{}'".format(cache_name))
+
+    if columns is None:
+        columns, min_volume = read_candidates(csv_file_name, totes, b_filter)
+
+        if b_cache:
+            # write to a temporary file first, so an interrupted run never leaves a broken cache behind
+            with open(cache_name + ".tmp", "wb") as cache:
+                np.savez(cache, key=key, min_volume=min_volume, **{idx.name: columns[idx] for idx in Idx})
+            os.replace(cache_name + ".tmp", cache_name)
+
+    # a list contains all candidate products (i.e. products that can fit into the tote individually)
+    # sorted by unit price in descending order
+    products = [Product(record) for record in zip(*(column.tolist() for column in columns))]
+
+    logging.info("total no. of candidate products = {}".format(len(products)))
+
+    return products, min_volume
+
+
+def read_candidates(csv_file_name, totes=(tote_dimensions,), b_filter=False):
+    # returns the columns (indexed by Idx) of the candidate products, sorted in the order of products.sort(reverse=True),
+    # and the min volume of all the products
+    # b_filter: also drop the dominated products after each chunk (see dominated_in_space()), only for a single
+    # tote without weight limit. The memory then stays flat, however big the input file is.
 
     # input csv file format (no header):
     # |     0      |   1   |    2   |   3   |   4    |   5    |
     # | product ID | price | length | width | height | weight |
     # |     /      | cents |   cm   |  cm   |   cm   |   g    |
     # ---------------------------------------------------------
-    inputs = pd.read_csv(csv_file_name, header=None, names=list(range(6)), nrows=num_rows)  # DataFrame
+    chunks = pd.read_csv(csv_file_name, header=None, names=list(range(6)), nrows=num_rows, chunksize=chunk_rows)
+    if chunk_rows is None:
+        chunks = [chunks]  # DataFrame
 
-    row, column = inputs.shape
-    logging.info("'{}' - row = {}, column = {}".format(csv_file_name, row, column))
+    start = time.perf_counter()
+    row, column, min_volume = 0, 6, None
+    kept = []  # the columns of the candidates in each chunk, in the order of the input file
+    for inputs in chunks:
+        # calculate volume and unit prices for all the products, column by column
+        columns = [inputs[idx].to_numpy(dtype=np.int64) for idx in range(column)]
+        columns.append(columns[Idx.length] * columns[Idx.width] * columns[Idx.height])
+        columns.append(columns[Idx.price] / columns[Idx.volume])
+
+        # updated format of columns
+        # |     0      |   1   |    2   |   3   |   4    |   5    |    6   |     7      |
+        # | product ID | price | length | width | height | weight | volume | unit price |
+        # |     /      | cents |   cm   |  cm   |   cm   |   g    |   cm3  |  cent/cm3  |
+        # -------------------------------------------------------------------------------
+        row += len(inputs)
+        if len(inputs) > 0:
+            min_volume = int(columns[Idx.volume].min()) if min_volume is None else \
+                min(min_volume, int(columns[Idx.volume].min()))
+
+        # dimensions: length, width and height of each product, sorted in ascending order
+        dimensions = np.sort(np.stack(columns[Idx.length:Idx.height + 1], axis=1), axis=1)
 
-    # calculate volume and unit prices for all the products
-    volumes = []
-    unit_prices = []
+        # same as Product.fits(): the product fits into (at least one of) the totes
+        fit = np.zeros(len(inputs), dtype=bool)
+        for tote in totes:
+            fit |= (dimensions <= sorted(tote)).all(axis=1)
+        columns = [column[fit] for column in columns]
 
-    for i in range(row):
-        volumes.append(inputs.iloc[i, Idx.length] * inputs.iloc[i, Idx.width] * inputs.iloc[i, Idx.height])
-        unit_prices.append(inputs.iloc[i, Idx.price] / volumes[i])
+        if b_filter:
+            capacity = totes[0][0] * totes[0][1] * totes[0][2]
+            if kept:
+                # most of the new candidates are already dominated by the candidates kept so far
+                dominated = dominated_by_kept(columns, kept[0], capacity)
+                columns = [column[~dominated] for column in columns]
+            columns = [np.concatenate(column) for column in zip(*kept, columns)]
+            dominated = dominated_in_space(columns, capacity)
+            kept = [[column[~dominated] for column in columns]]
+        else:
+            kept.append(columns)
+
+        elapsed = time.perf_counter() - start
+        logging.info("'{}' - {} rows read, {} candidates kept, {:.0f} rows/s".
+                     format(csv_file_name, row, sum(len(columns[0]) for columns in kept), row / max(elapsed, 1e-9)))
 
-    min_volume = min(volumes)
+    logging.info("'{}' - row = {}, column = {}".format(csv_file_name, row, column))
     logging.info("min volume = {}".format(min_volume))
+    columns = [np.concatenate(column) for column in zip(*kept)]
 
-    # add volume and unit price as new columns of inputs
-    inputs[Idx.volume] = pd.Series(volumes, index=inputs.index)
-    inputs[Idx.unit_price] = pd.Series(unit_prices, index=inputs.index)
+    # same order as sorting the products by Product.__lt__ in descending order: higher unit price first,
+    # then bigger volume, then lighter weight (a stable sort, i.e. ties keep the order in the input file)
+    order = np.lexsort((columns[Idx.weight], -columns[Idx.volume], -columns[Idx.unit_price]))
 
-    # updated format of inputs
-    # |     0      |   1   |    2   |   3   |   4    |   5    |    6   |     7      |
-    # | product ID | price | length | width | height | weight | volume | unit price |
-    # |     /      | cents |   cm   |  cm   |   cm   |   g    |   cm3  |  cent/cm3  |
-    # -------------------------------------------------------------------------------
+    return [column[order] for column in columns], min_volume
 
-    products = []  # a list contains all candidate products (i.e. products that can fit into the tote individually)
-    for i in range(row):
-        # dimensions is a list containing length, width and height of a product, sorted in ascending order
-        dimensions = sorted([inputs.iloc[i, Idx.length], inputs.iloc[i, Idx.width], inputs.iloc[i, Idx.height]])
 
-        # Assume that the orientation of a product doesn't matter
-        # (i.e. no request to place the product upright always).
-        # For simplicity, only consider the potential rotation of the product be 90, 180, 270 degrees.
-        if dimensions[0] > 30 or dimensions[1] > 35 or dimensions[2] > 45:
-            # the product doesn't fit into the tote
-            continue
+def dominated_by_kept(columns, kept, capacity, num_edges=64):
+    # a quick (vectorized) check of dominated_in_space(), with the kept products as the only dominating
+    # products: for a few volume edges, the kept products not bigger than the edge are sorted by value (then
+    # lighter weight), with the running sums of their volumes. The products of B's edge (the largest edge
+    # not bigger than B) that are better than B dominate B, so B is dominated if B and these products
+    # can't fit into the tote together. It may miss some dominated products, never the other way round.
+    # columns, kept: the columns of the new and the kept products, returns the mask of the dominated products
+    scale = int(max(columns[Idx.weight].max(initial=0), kept[Idx.weight].max(initial=0))) + 1
+    if int(max(columns[Idx.price].max(initial=0), kept[Idx.price].max(initial=0))) * scale >= np.iinfo(np.int64).max:
+        return np.zeros(len(columns[Idx.volume]), dtype=bool)
+    # higher value, or same value and lighter weight, is a bigger key
+    keys = columns[Idx.price] * scale - columns[Idx.weight]
+    kept_keys = kept[Idx.price] * scale - kept[Idx.weight]
 
-        # the product can fit into the tote, add it to the candidate list
-        products.append(Product(inputs.iloc[i]))
+    volumes = np.unique(kept[Idx.volume])
+    edges = volumes[::max(1, len(volumes) // num_edges)]
+    edge_of = np.searchsorted(edges, columns[Idx.volume], "right") - 1
 
-    logging.info("total no. of candidate products = {}".format(len(products)))
+    dominated = np.zeros(len(keys), dtype=bool)
+    for e, edge in enumerate(edges.tolist()):
+        selected = kept[Idx.volume] <= edge
+        # the kept products by key in ascending order, and the sums of the volumes from the biggest key down
+        order = np.argsort(kept_keys[selected], kind="stable")
+        edge_keys = kept_keys[selected][order]
+        volume_sums = np.concatenate(([0], np.cumsum(kept[Idx.volume][selected][order][::-1])))
 
-    products.sort(reverse=True)  # sort products by unit price in descending order
+        products = np.flatnonzero(edge_of == e)
+        better = len(edge_keys) - np.searchsorted(edge_keys, keys[products], "right")
+        dominated[products] = columns[Idx.volume][products] + volume_sums[better] > capacity
 
-    return products, min_volume
+    return dominated
+
+
+def dominated_in_space(columns, capacity):
+    # product A dominates product B if A is not bigger (volume) and better (higher value, or same value and
+    # lighter weight). If B and all the products dominating it can't fit into the tote together, one of
+    # them is left out of any tote with B, and swapping it in for B gives a better tote, so B is never in the
+    # best tote (without weight limit). Unlike the count in reduce_candidates(), this doesn't depend on the
+    # min volume of all the products, so it holds for any part of the input file: more products only add
+    # more dominating products.
+    # columns: the columns of the products (indexed by Idx), returns the mask of the dominated products
+    volumes = columns[Idx.volume].tolist()
+    num_products = len(volumes)
+
+    # visit the products from the best to the worst, and sum up the volumes of the visited products that are
+    # not bigger, with a Fenwick tree indexed by (ranks of) volumes
+    ranks = np.searchsorted(np.unique(columns[Idx.volume]), columns[Idx.volume]) + 1
+    ranks = ranks.tolist()
+    tree = [0] * (max(ranks, default=0) + 1)
+    by_value = np.lexsort((columns[Idx.weight], -columns[Idx.price])).tolist()
+    keys = list(zip(columns[Idx.price].tolist(), columns[Idx.weight].tolist()))
+
+    dominated = np.zeros(num_products, dtype=bool)
+    group = []
+    for k, i in enumerate(by_value):
+        group.append(i)
+        if k + 1 < num_products and keys[by_value[k + 1]] == keys[i]:
+            continue
+
+        # products with same value and weight don't dominate each other
+        for j in group:
+            total, r = volumes[j], ranks[j]
+            while r > 0:
+                total += tree[r]
+                r -= r & -r
+            dominated[j] = total > capacity
+        for j in group:
+            r = ranks[j]
+            while r < len(tree):
+                tree[r] += volumes[j]
+                r += r & -r
+        group = []
+
+    return dominated
 
 
 def write_to_csv(products, num_lines):
@@ -201,46 +391,1163 @@ def write_to_csv(products, num_lines):
                                  products[i].volume, products[i].weight, products[i].unit_price])
 
 
-def main():
-    products, min_volume = process_input("./products.csv")
-
-    max_num = tote_volume//min_volume
-    logging.info("max number of products in the tote = {}".format(max_num))
-
-    # products are already sorted according to unit price, volume and weight
-    # since there are only maximum of max_num products that can fit into the tote,
-    # search the top candidates (e.g. choose 3 times of the max_num) instead of the complete list
-    products = products[0: max_num * 3]  # to search the whole list, skip this line
-
-    # write_to_csv(products, len(products)-1)
-
+def solve_table(products, min_volume, capacity=tote_volume):
     # originally: need a table of size (len(products) + 1) x (tote_volume - 1) to save the BestStates
     # optimization: (saving in both computation time and space)
     #   reduce the table size by (min_volume - 1) columns, since nothing can fit if the space is less than min_volume
     # finally: table size = (len(products) + 1) x (tote_volume - min_volume + 2)
-    table = [[BestState(i, min_volume) for i in range(tote_volume - min_volume + 2)] for j in range(len(products) + 1)]
+    if capacity < min_volume:
+        # nothing can fit into the tote
+        return Basket(capacity, "TOTE")
+
+    table = [[BestState(i, min_volume) for i in range(capacity - min_volume + 2)] for j in range(len(products) + 1)]
 
     for i in range(1, len(table)):
-        for j in range(1, tote_volume - min_volume + 2):
+        for j in range(1, capacity - min_volume + 2):
             x = j - products[i-1].volume
             table[i][j].update_state(table[i-1][j], table[i-1][max(0, x)], products[i-1])
 
-    final = table[len(products)][tote_volume - min_volume + 1]
+    final = table[len(products)][capacity - min_volume + 1]
 
     # the sum of IDs is already obtained in the "final" BestState
     logging.info("best total value = {}, weight = {}, ID sum = {}".
                  format(final.value, final.weight, final.id_sum))
 
     # to obtain details of products in the tote
-    tote = Basket(tote_volume, "TOTE")
+    tote = Basket(capacity, "TOTE")
 
-    j = tote_volume - min_volume + 1
+    j = capacity - min_volume + 1
     for i in range(len(products), 0, -1):
-        if table[i][j].value != table[i-1][j].value:
+        # the product is taken if the state differs from the one without it (i.e. higher value or lighter weight)
+        if table[i][j].value != table[i-1][j].value or table[i][j].weight != table[i-1][j].weight:
             tote.add_a_product(products[i-1])
             x = j - products[i-1].volume
             j = max(0, x)
 
+    return tote
+
+
+def solve_rolling(products, min_volume, capacity=tote_volume):
+    # same recurrence as solve_table(), but the row of product i only depends on the row of product i - 1,
+    # so only one row of states is kept (updated in place from the largest space down to the smallest)
+    # the states are kept in typed arrays, indexed by space (0 ~ capacity)
+    # nothing can fit into a space less than min_volume, those states stay empty
+    values = array("q", bytes(8 * (capacity + 1)))
+    weights = array("q", bytes(8 * (capacity + 1)))
+    id_sums = array("q", bytes(8 * (capacity + 1)))
+
+    # decisions: 1 bit per product and space, set if the product is taken into the best state of that space
+    row_bytes = capacity // 8 + 1
+    decisions = bytearray(row_bytes * len(products))
+
+    for i, product in enumerate(products):
+        volume, value, weight = product.volume, product.value, product.weight
+        offset = i * row_bytes
+        for space in range(capacity, max(volume, min_volume) - 1, -1):
+            # same rule as BestState.update_state: higher value wins, break tie with lighter weight
+            new_value = values[space - volume] + value
+            new_weight = weights[space - volume] + weight
+            if new_value > values[space] or (new_value == values[space] and new_weight < weights[space]):
+                values[space] = new_value
+                weights[space] = new_weight
+                id_sums[space] = id_sums[space - volume] + product.p_id
+                decisions[offset + (space >> 3)] |= 1 << (space & 7)
+
+    logging.info("best total value = {}, weight = {}, ID sum = {}".
+                 format(values[capacity], weights[capacity], id_sums[capacity]))
+
+    # to obtain details of products in the tote, follow the decisions from the last product back to the first
+    tote = Basket(capacity, "TOTE")
+
+    space = capacity
+    for i in range(len(products) - 1, -1, -1):
+        if decisions[i * row_bytes + (space >> 3)] >> (space & 7) & 1:
+            tote.add_a_product(products[i])
+            space -= products[i].volume
+
+    return tote
+
+
+def solve_numpy(products, min_volume, capacity=tote_volume):
+    # same as solve_rolling(), but each row is updated at once with shifted numpy arrays
+    decisions = numpy_decisions(products, capacity)
+
+    tote = Basket(capacity, "TOTE")
+    for product in follow_decisions(products, decisions, len(products), capacity):
+        tote.add_a_product(product)
+
+    logging.info("best total value = {}, weight = {}, ID sum = {}".format(tote.value, tote.weight, tote.id_sum))
+
+    return tote
+
+
+def pack_keys(products):
+    # value and weight of a state are packed into a single key, so a single comparison picks the
+    # higher value and breaks tie with the lighter weight (same rule as BestState.__lt__):
+    #   key = value * weight_scale - weight, where weight_scale is larger than any total weight
+    p_values = np.array([product.value for product in products], dtype=np.int64)
+    p_weights = np.array([product.weight for product in products], dtype=np.int64)
+    weight_scale = int(p_weights.sum()) + 1
+    if int(p_values.sum()) * weight_scale >= np.iinfo(np.int64).max:
+        raise Exception("Total value and weight of the products are too large to be packed into a key")
+    return p_values * weight_scale - p_weights
+
+
+def numpy_decisions(products, capacity, keys=None, p_keys=None, scale=1):
+    # run the DP over the products with one row of states, and return the decisions of all the products:
+    # 1 bit per product and space, set if the product is taken into the best state of that space
+    # keys, p_keys: the row of states before the first product (all zeros if None) and the keys of the products
+    # scale: the spaces are in units of scale (cm3), all the volumes must be multiples of it
+    if p_keys is None:
+        p_keys = pack_keys(products)
+
+    keys = np.zeros(capacity + 1, dtype=np.int64) if keys is None else keys.copy()
+    decisions = np.zeros((len(products), (capacity + 1 + 7) // 8), dtype=np.uint8)
+
+    for i, product in enumerate(products):
+        volume = product.volume // scale
+        if volume > capacity:
+            continue
+
+        # the new state of space s (s >= volume) takes the product into the old state of space (s - volume)
+        candidates = keys[:capacity + 1 - volume] + p_keys[i]
+        taken = candidates > keys[volume:]
+
+        keys[volume:] = np.where(taken, candidates, keys[volume:])
+        decisions[i] = np.packbits(np.concatenate((np.zeros(volume, dtype=bool), taken)), bitorder="little")
+
+    return decisions
+
+
+def solve_compressed(products, min_volume, capacity=tote_volume):
+    # same as solve_numpy() (exactly the same products in the tote), but with a shorter capacity axis:
+    # 1. all the volumes are multiples of their GCD, so are the volumes of all the totes. The spaces are
+    #    counted in units of the GCD.
+    # 2. most of the spaces hold the same state as a smaller space (the row of states is a step function of the
+    #    space), so the row is kept as a sorted list of the spaces where the state changes (sparse states).
+    #    A sparse step takes longer per state than a dense row per space, so the sparse states are only used
+    #    while they are estimated to be cheaper, then expanded to a dense row for the rest of the products.
+    products = [product for product in products if product.volume <= capacity]
+    scale = reduce(math.gcd, (product.volume for product in products), 0) or 1
+    space = capacity // scale
+    p_keys = pack_keys(products)
+
+    # estimated cost of a sparse step, in the cost of a dense row per space (measured with numpy)
+    sparse_step_cost, sparse_state_cost = 20000, 60
+
+    # sparse states: the spaces (ascending) where the state changes and the keys of the states
+    spaces, keys = np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    # each step: the index of the state in the previous step, and whether the product is taken
+    steps = []
+    num_sparse, num_states = 0, 0
+    while num_sparse < len(products) and sparse_step_cost + sparse_state_cost * len(spaces) < space + 1:
+        volume, p_key = products[num_sparse].volume // scale, int(p_keys[num_sparse])
+
+        # the state may change at the old spaces, or at the old spaces + volume
+        points = np.concatenate((spaces, spaces[:np.searchsorted(spaces, space - volume, "right")] + volume))
+        points.sort(kind="stable")
+        # the old states of the points, and of (points - volume)
+        old = np.searchsorted(spaces, points, "right") - 1
+        previous = np.searchsorted(spaces, points - volume, "right") - 1
+        candidates = keys[previous] + p_key
+        taken = (previous >= 0) & (candidates > keys[old])
+        sources = np.where(taken, previous, old)
+
+        # only keep the points where the state changes (including the same key from a different state)
+        b_change = np.ones(len(points), dtype=bool)
+        b_change[1:] = (sources[1:] != sources[:-1]) | (taken[1:] != taken[:-1])
+        spaces, taken, sources = points[b_change], taken[b_change], sources[b_change]
+        keys = np.where(taken, candidates[b_change], keys[sources])
+
+        steps.append((sources, taken))
+        num_sparse += 1
+        num_states += len(spaces)
+
+    logging.info("GCD of volumes = {}, {} products on sparse states ({} states), {} products on dense rows "
+                 "({} spaces)".format(scale, num_sparse, num_states, len(products) - num_sparse, space + 1))
+
+    taken = []
+    if num_sparse < len(products):
+        # expand the sparse states to a dense row of all the spaces
+        row = keys[np.searchsorted(spaces, np.arange(space + 1), "right") - 1]
+        decisions = numpy_decisions(products[num_sparse:], space, row, p_keys[num_sparse:], scale)
+        taken = follow_decisions(products[num_sparse:], decisions, len(products) - num_sparse, space, scale)
+        space -= sum(product.volume // scale for product in taken)
+
+    # follow the sparse steps back, from the state of the space left
+    state = np.searchsorted(spaces, space, "right") - 1
+    for i in range(num_sparse - 1, -1, -1):
+        sources, b_taken = steps[i]
+        if b_taken[state]:
+            taken.append(products[i])
+        state = sources[state]
+
+    tote = Basket(capacity, "TOTE")
+    for product in taken:
+        tote.add_a_product(product)
+
+    logging.info("best total value = {}, weight = {}, ID sum = {}".format(tote.value, tote.weight, tote.id_sum))
+
+    return tote
+
+
+def solve_hirschberg(products, min_volume, capacity=tote_volume, leaf_size=64):
+    # same as solve_numpy(), but without the decisions of all the products (Hirschberg-style divide and conquer):
+    # the decisions of product i in solve_numpy() only depend on the best states of products 0 to i - 1 (prefix
+    # row). To follow the decisions of a range of products from space s, split the range into 2 halves, run the
+    # DP over the 1st half from the prefix row of the range to get the prefix row of the 2nd half, follow the
+    # 2nd half from space s, then the 1st half from the space left. A range of up to leaf_size products is
+    # followed by its decisions (leaf_size bits per space).
+    # Only one prefix row per level of the split is kept, i.e. log2(number of products / leaf_size) rows of
+    # states, and the products in the tote are exactly the same as solve_numpy()
+    p_keys = pack_keys(products)
+
+    def follow(low, high, keys, space):
+        # keys: the prefix row of product 'low' (up to 'space'), returns the products taken and the space left
+        if high - low <= leaf_size:
+            decisions = numpy_decisions(products[low:high], space, keys, p_keys[low:high])
+            taken = follow_decisions(products[low:high], decisions, high - low, space)
+            return taken, space - sum(product.volume for product in taken)
+
+        middle = (low + high) // 2
+        taken_second, space = follow(middle, high, numpy_row(products[low:middle], p_keys[low:middle], keys), space)
+        taken_first, space = follow(low, middle, keys[:space + 1], space)
+        return taken_second + taken_first, space
+
+    taken, space = follow(0, len(products), np.zeros(capacity + 1, dtype=np.int64), capacity)
+
+    tote = Basket(capacity, "TOTE")
+    for product in taken:
+        tote.add_a_product(product)
+
+    logging.info("best total value = {}, weight = {}, ID sum = {}".format(tote.value, tote.weight, tote.id_sum))
+
+    return tote
+
+
+def numpy_row(products, p_keys, keys):
+    # the new row of states after the products, starting from the row keys (see numpy_decisions())
+    keys = keys.copy()
+    capacity = len(keys) - 1
+    for volume, p_key in zip((product.volume for product in products), p_keys):
+        if volume <= capacity:
+            keys[volume:] = np.maximum(keys[volume:], keys[:capacity + 1 - volume] + p_key)
+
+    return keys
+
+
+def solve_parallel(products, min_volume, capacity=tote_volume, workers=None):
+    # same as solve_numpy(), but the row of each product is updated by several worker processes
+    decisions = parallel_decisions(products, capacity, workers)
+
+    tote = Basket(capacity, "TOTE")
+    for product in follow_decisions(products, decisions, len(products), capacity):
+        tote.add_a_product(product)
+
+    logging.info("best total value = {}, weight = {}, ID sum = {}".format(tote.value, tote.weight, tote.id_sum))
+
+    return tote
+
+
+def parallel_decisions(products, capacity, workers=None):
+    # same as numpy_decisions(), but the capacity axis is split into ranges of spaces, one per worker process
+    # the new state of space s depends on the old state of space (s - volume), which may belong to another
+    # worker, so there are two rows of states in shared memory: the old row (read only) and the new row.
+    # All the workers wait at a barrier after each product, then the rows swap their roles.
+    from multiprocessing import shared_memory  # Python 3.8+, only needed by this engine
+
+    workers = workers or num_workers or os.cpu_count()
+    num_products, num_bytes = len(products), (capacity + 1 + 7) // 8
+    # each worker takes whole bytes of the decisions
+    workers = max(1, min(workers, num_bytes))
+    step = (num_bytes + workers - 1) // workers * 8
+
+    blocks = [shared_memory.SharedMemory(create=True, size=max(1, size)) for size in
+              (num_products * 8, num_products * 8, 2 * (capacity + 1) * 8, num_products * num_bytes)]
+    try:
+        p_keys, volumes, keys, decisions = (
+            np.ndarray(shape, dtype=dtype, buffer=block.buf) for block, shape, dtype in
+            zip(blocks, ((num_products,), (num_products,), (2, capacity + 1), (num_products, num_bytes)),
+                (np.int64, np.int64, np.int64, np.uint8)))
+        p_keys[:] = pack_keys(products)
+        volumes[:] = [product.volume for product in products]
+        keys[0] = 0
+
+        starts = range(0, capacity + 1, step)
+        barrier = Barrier(len(starts))
+        processes = [Process(target=parallel_worker,
+                             args=([block.name for block in blocks], num_products, capacity,
+                                   start, min(start + step, capacity + 1), barrier))
+                     for start in starts]
+        logging.info("{} workers, {} spaces each".format(len(processes), step))
+        for process in processes:
+            process.start()
+        # a failed worker never reaches the barrier again, break it so the other workers stop waiting
+        while any(process.is_alive() for process in processes):
+            if any(process.exitcode not in (None, 0) for process in processes):
+                barrier.abort()
+            for process in processes:
+                process.join(0.1)
+        if any(process.exitcode != 0 for process in processes):
+            raise Exception("A worker process of the parallel engine failed")
+
+        result = decisions.copy()
+        del p_keys, volumes, keys, decisions
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return result
+
+
+def parallel_worker(names, num_products, capacity, start, end, barrier):
+    # update the states (and the decisions) of spaces from start to end - 1 for all the products
+    # start is a multiple of 8, so the worker owns whole bytes of the decisions
+    from multiprocessing import shared_memory
+
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    num_bytes = (capacity + 1 + 7) // 8
+    p_keys, volumes, keys, decisions = (
+        np.ndarray(shape, dtype=dtype, buffer=block.buf) for block, shape, dtype in
+        zip(blocks, ((num_products,), (num_products,), (2, capacity + 1), (num_products, num_bytes)),
+            (np.int64, np.int64, np.int64, np.uint8)))
+
+    for i in range(num_products):
+        old, new = keys[i & 1], keys[(i + 1) & 1]
+        # the spaces less than the volume keep their old states, only within the range of the worker
+        low = min(max(start, int(volumes[i])), end)
+        new[start:low] = old[start:low]
+        if low < end:
+            candidates = old[low - volumes[i]:end - volumes[i]] + p_keys[i]
+            taken = candidates > old[low:end]
+            new[low:end] = np.where(taken, candidates, old[low:end])
+            decisions[i, start >> 3:(end + 7) >> 3] = np.packbits(
+                np.concatenate((np.zeros(low - start, dtype=bool), taken)), bitorder="little")
+        del old, new
+        barrier.wait()
+
+    del p_keys, volumes, keys, decisions
+    for block in blocks:
+        block.close()
+
+
+def follow_decisions(products, decisions, num_products, space, scale=1):
+    # the products in the best state of 'space' among the first 'num_products' products
+    # follow the decisions from the last product back to the first
+    taken = []
+    for i in range(num_products - 1, -1, -1):
+        if decisions[i, space >> 3] >> (space & 7) & 1:
+            taken.append(products[i])
+            space -= products[i].volume // scale
+
+    return taken
+
+
+def lp_upper_bound(products):
+    # returns a function giving the LP bound of the totes with value, space left and only products from i
+    # on to add, i.e. filling the space in the order of unit price with a fraction of the last product
+    # products: sorted by unit price in descending order
+    num_products = len(products)
+    volumes = [product.volume for product in products]
+    values = [product.value for product in products]
+
+    # prefix sums of volumes and values, to find the LP bound from any product in O(log n)
+    volume_sums = [0] + list(accumulate(volumes))
+    value_sums = [0] + list(accumulate(values))
+
+    def upper_bound(i, space, value):
+        # all the products from i to k - 1 fit into the space, product k only fits partly
+        k = bisect_right(volume_sums, volume_sums[i] + space, lo=i) - 1
+        bound = value + value_sums[k] - value_sums[i]
+        if k < num_products:
+            bound += values[k] * (space - volume_sums[k] + volume_sums[i]) // volumes[k]
+        return bound
+
+    return upper_bound
+
+
+def solve_branch_and_bound(products, min_volume, capacity=tote_volume):
+    # depth-first search on taking (first) or skipping each product, in the order of unit price
+    # (products are sorted by Product.__lt__ in descending order). A branch is pruned if its upper bound,
+    # i.e. the LP relaxation filling the rest of the space in the order of unit price with a fraction of
+    # the last product, can't beat the best tote so far (higher value, or same value and lighter weight)
+    num_products = len(products)
+    volumes = [product.volume for product in products]
+    values = [product.value for product in products]
+    weights = [product.weight for product in products]
+    upper_bound = lp_upper_bound(products)
+
+    # identical products (same volume, value and weight) are next to each other in the order of unit price,
+    # and any tote can take the first ones of them instead, so skipping one of them skips the rest as well
+    # skip_to[i]: the index of the first product after i which is different from it
+    skip_to = list(range(1, num_products + 1))
+    for i in range(num_products - 2, -1, -1):
+        if (volumes[i], values[i], weights[i]) == (volumes[i + 1], values[i + 1], weights[i + 1]):
+            skip_to[i] = skip_to[i + 1]
+
+    best_value, best_weight, best_taken = 0, 0, None
+    nodes = 0
+
+    # each node: (index of the next product, space left, value, weight, products taken as a linked list)
+    stack = [(0, capacity, 0, 0, None)]
+    while stack:
+        i, space, value, weight, taken = stack.pop()
+        nodes += 1
+
+        # every node is a valid tote
+        if value > best_value or (value == best_value and weight < best_weight):
+            best_value, best_weight, best_taken = value, weight, taken
+
+        if i == num_products or space < min_volume:
+            continue
+
+        bound = upper_bound(i, space, value)
+        if bound < best_value or (bound == best_value and weight >= best_weight):
+            # can't beat the best tote: the weight can only grow
+            continue
+
+        # skip product i and the identical products after it (explored after taking it)
+        stack.append((skip_to[i], space, value, weight, taken))
+        # take product i (explored first)
+        if volumes[i] <= space:
+            stack.append((i + 1, space - volumes[i], value + values[i], weight + weights[i], (i, taken)))
+
+    logging.info("branch and bound: {} nodes visited".format(nodes))
+
+    tote = Basket(capacity, "TOTE")
+    while best_taken is not None:
+        i, best_taken = best_taken
+        tote.add_a_product(products[i])
+
+    logging.info("best total value = {}, weight = {}, ID sum = {}".format(tote.value, tote.weight, tote.id_sum))
+
+    return tote
+
+
+def solve_pareto(products, min_volume, capacity=tote_volume, max_weight=tote_max_weight):
+    # the products in the tote must not be heavier than max_weight in total (no limit if None)
+    # instead of a table with a dense weight axis, only the sparse states (volume, weight, value) of the
+    # totes found so far are kept if they are Pareto-optimal: a state is dropped if another state is not
+    # bigger, not heavier and not less valuable, as any products added to it can be added to the other too
+    # products: sorted by unit price in descending order, the states are also pruned by the LP bounds
+    if max_weight is None:
+        max_weight = sum(product.weight for product in products)
+    upper_bound = lp_upper_bound(products)
+
+    # each state: (volume, weight, value, products taken as a linked list)
+    states = [(0, 0, 0, None)]
+    max_states = 1
+    for i, product in enumerate(products):
+        if product.volume > capacity or product.weight > max_weight:
+            continue
+        states += [(volume + product.volume, weight + product.weight, value + product.value, (i, taken))
+                   for volume, weight, value, taken in states
+                   if volume + product.volume <= capacity and weight + product.weight <= max_weight]
+
+        # visit the states by volume: a state is dominated if one of the visited states is not heavier and
+        # not less valuable. The visited states that are not dominated are kept as a staircase, in the order
+        # of weight (ascending) with ascending values
+        states.sort(key=lambda state: (state[0], state[1], -state[2]))
+        step_weights, step_values = [], []
+        kept = []
+        for state in states:
+            weight, value = state[1], state[2]
+            k = bisect_right(step_weights, weight)
+            if k > 0 and step_values[k - 1] >= value:
+                continue
+            kept.append(state)
+
+            # replace the steps dominated by the new state (not lighter and not more valuable)
+            end = k
+            while end < len(step_weights) and step_values[end] <= value:
+                end += 1
+            step_weights[k:end] = [weight]
+            step_values[k:end] = [value]
+
+        # drop the states which can't reach the value of the best state (a known tote) with the products left
+        best_value = max(state[2] for state in kept)
+        states = [state for state in kept if upper_bound(i + 1, capacity - state[0], state[2]) >= best_value]
+        max_states = max(max_states, len(states))
+
+    logging.info("pareto: {} states at most, {} states in the end".format(max_states, len(states)))
+
+    # the best tote: highest value, then lightest weight
+    best_taken = max(states, key=lambda state: (state[2], -state[1]))[3]
+
+    tote = Basket(capacity, "TOTE")
+    while best_taken is not None:
+        i, best_taken = best_taken
+        tote.add_a_product(products[i])
+
+    logging.info("best total value = {}, weight = {}, ID sum = {}".format(tote.value, tote.weight, tote.id_sum))
+
+    return tote
+
+
+def solve_anytime(products, min_volume, capacity=tote_volume, budget=anytime_budget):
+    # the last (best) tote of anytime_totes() within the time budget (seconds)
+    tote = None
+    for tote, _ in anytime_totes(products, min_volume, capacity, budget):
+        pass
+
+    return tote
+
+
+def anytime_totes(products, min_volume, capacity=tote_volume, budget=anytime_budget):
+    # yields the better and better totes found within the time budget (seconds), each with the best upper bound
+    # of the total value found so far (i.e. the best tote is never more valuable than the upper bound):
+    #   1. greedy: fill the tote in the order of unit price (see Basket.fill_a_basket() in prize_old.py),
+    #      the upper bound is the LP bound
+    #   2. pair swaps: swap a product in the tote for a single product or a pair of products not in it, near
+    #      the first product the greedy fill skips (see find_the_best_pair() in prize_old.py)
+    #   3. FPTAS: solve the DP on scaled values (value * 2^p * max_num // best value), for p = 0, 1, 2, ...
+    #      The tote found is at most best value / 2^p less valuable than the best tote, and gives an upper
+    #      bound. Each pass takes about twice as long as the previous one, stop if it can't finish in time
+    #      (estimated from the time per DP cell of the previous pass), or drop it when it runs out of time.
+    # products: sorted by unit price in descending order
+    start = time.perf_counter()
+    products = [product for product in products if product.volume <= capacity]
+    # max number of products in a tote
+    max_num = min(len(products), capacity // min_volume)
+
+    def report(name, tote, upper_bound):
+        logging.info("anytime: {} - value = {}, weight = {}, upper bound = {}, gap = {:.3%}, {:.3f} s".
+                     format(name, tote.value, tote.weight, upper_bound,
+                            (upper_bound - tote.value) / max(upper_bound, 1), time.perf_counter() - start))
+
+    def better(tote, best):
+        return tote.value > best.value or (tote.value == best.value and tote.weight < best.weight)
+
+    # 1. greedy fill
+    best = Basket(capacity, "TOTE")
+    taken = [False] * len(products)
+    for i, product in enumerate(products):
+        if capacity - best.volume >= product.volume:
+            best.add_a_product(product)
+            taken[i] = True
+    upper_bound = lp_upper_bound(products)(0, capacity, 0) if products else 0
+    report("greedy", best, upper_bound)
+    yield best, upper_bound
+
+    # 2. pair swaps: the products not in the tote, from the first one skipped
+    window = [i for i in range(len(products)) if not taken[i]][:64]
+    improved = True
+    while improved and best.value < upper_bound and time.perf_counter() - start < budget:
+        improved = False
+        space_left = capacity - best.volume
+        best_swap, best_gain = None, (0, 0)
+        for out in best.items:
+            if time.perf_counter() - start > budget:
+                break
+            space = space_left + out.volume
+            for a, i in enumerate(window):
+                if products[i].volume > space:
+                    continue
+                gain = (products[i].value - out.value, out.weight - products[i].weight)
+                if gain > best_gain:
+                    best_swap, best_gain = (out, [i]), gain
+                for j in window[a + 1:]:
+                    if products[i].volume + products[j].volume <= space:
+                        gain = (products[i].value + products[j].value - out.value,
+                                out.weight - products[i].weight - products[j].weight)
+                        if gain > best_gain:
+                            best_swap, best_gain = (out, [i, j]), gain
+
+        if best_swap is not None:
+            out, swapped_in = best_swap
+            tote = Basket(capacity, "TOTE")
+            for product in best.items:
+                if product is not out:
+                    tote.add_a_product(product)
+            for i in swapped_in:
+                tote.add_a_product(products[i])
+            window = [i for i in window if i not in swapped_in] + \
+                [i for i, product in enumerate(products) if product is out]
+            best, improved = tote, True
+            report("pair swap", best, upper_bound)
+            yield best, upper_bound
+
+    # 3. FPTAS passes
+    p, cell_time = 0, 0
+    volumes = np.array([product.volume for product in products], dtype=np.int64)
+    while best.value > 0 and best.value < upper_bound:
+        pass_start = time.perf_counter()
+
+        # scaled values: value / scale with scale = best value / (max_num * 2^p), the totes in the DP are
+        # at most max_num * scale = best value / 2^p less valuable than their real value
+        lower_bound, factor = best.value, max_num << p
+        scaled = [product.value * factor // lower_bound for product in products]
+        # no tote is more valuable than the upper bound, so is its scaled value
+        total = upper_bound * factor // lower_bound
+
+        if pass_start - start + cell_time * len(products) * (total + 1) > budget:
+            break
+
+        # min volume of each scaled value (exactly), and the decisions to find the products
+        infinity = capacity + 1
+        min_volumes = np.full(total + 1, infinity, dtype=np.int64)
+        min_volumes[0] = 0
+        decisions = np.zeros((len(products), (total + 1 + 7) // 8), dtype=np.uint8)
+        b_timeout = False
+        for i, value in enumerate(scaled):
+            if time.perf_counter() - start > budget:
+                b_timeout = True
+                break
+            if value == 0 or value > total:
+                continue
+            candidates = min_volumes[:total + 1 - value] + volumes[i]
+            b_taken = candidates < min_volumes[value:]
+            min_volumes[value:] = np.where(b_taken, candidates, min_volumes[value:])
+            decisions[i] = np.packbits(np.concatenate((np.zeros(value, dtype=bool), b_taken)), bitorder="little")
+        if b_timeout:
+            # the pass can't finish in time, drop it
+            break
+
+        # the highest scaled value fitting into the tote
+        value = int(np.flatnonzero(min_volumes <= capacity)[-1])
+        # the best tote is at most (value + max_num) * scale, as its scaled value is at least
+        # (its value / scale - max_num), and not more than the scaled value found
+        upper_bound = min(upper_bound, (value + max_num) * lower_bound // factor)
+
+        tote = Basket(capacity, "TOTE")
+        for i in range(len(products) - 1, -1, -1):
+            if decisions[i, value >> 3] >> (value & 7) & 1:
+                tote.add_a_product(products[i])
+                value -= scaled[i]
+        # fill the space left greedily
+        in_tote = set(id(product) for product in tote.items)
+        for product in products:
+            if id(product) not in in_tote and capacity - tote.volume >= product.volume:
+                tote.add_a_product(product)
+
+        if better(tote, best):
+            best = tote
+        cell_time = (time.perf_counter() - pass_start) / max(len(products) * (total + 1), 1)
+        report("FPTAS 1/{}".format(1 << p), best, upper_bound)
+        yield best, upper_bound
+        p += 1
+
+
+def dominated_by_volume(products, max_num):
+    # find the products dominated by at least max_num other products (see reduce_candidates())
+    # returns the set of indexes of the dominated products
+    num_products = len(products)
+
+    # count the dominating products of each product: visit the products from the best to the worst, and
+    # count the visited products that are not bigger, with a Fenwick tree indexed by (ranks of) volumes
+    volumes = sorted(set(product.volume for product in products))
+    rank = {volume: i + 1 for i, volume in enumerate(volumes)}
+    tree = [0] * (len(volumes) + 1)
+    by_value = sorted(range(num_products), key=lambda i: (-products[i].value, products[i].weight))
+
+    dominated = set()
+    group = []
+    for k, i in enumerate(by_value):
+        group.append(i)
+        if k + 1 < num_products and (products[by_value[k + 1]].value, products[by_value[k + 1]].weight) == \
+                (products[i].value, products[i].weight):
+            continue
+
+        # products with same value and weight don't dominate each other
+        for j in group:
+            count, r = 0, rank[products[j].volume]
+            while r > 0:
+                count += tree[r]
+                r -= r & -r
+            if count >= max_num:
+                dominated.add(j)
+        for j in group:
+            r = rank[products[j].volume]
+            while r < len(tree):
+                tree[r] += 1
+                r += r & -r
+        group = []
+
+    return dominated
+
+
+def dominated_by_weight(products, max_num):
+    # same as dominated_by_volume(), but product A must also be not heavier than product B
+    # the dominating products are counted in blocks of products with numpy arrays
+    volumes = np.array([product.volume for product in products], dtype=np.int64)
+    weights = np.array([product.weight for product in products], dtype=np.int64)
+    values = np.array([product.value for product in products], dtype=np.int64)
+
+    dominated = set()
+    block = 1024
+    for start in range(0, len(products), block):
+        end = min(start + block, len(products))
+        # rows: product B in the block, columns: product A
+        better = (values > values[start:end, None]) | \
+                 ((values == values[start:end, None]) & (weights < weights[start:end, None]))
+        count = ((volumes <= volumes[start:end, None]) & (weights <= weights[start:end, None]) & better).sum(axis=1)
+        dominated.update((start + np.flatnonzero(count >= max_num)).tolist())
+
+    return dominated
+
+
+def reduce_candidates(products, capacity=tote_volume, max_weight=None):
+    # remove the candidate products which can't be in the best tote, and find the products which must be in it
+    # both stages are exact, i.e. the best total value and weight are the same as solving all the candidates
+    # products: sorted by unit price in descending order (same as process_input())
+    # max_weight: the weight limit of the tote (see solve_pareto()), None for no limit
+    # returns the products which must be in the tote, and the remaining candidates (in the same order)
+    start = time.perf_counter()
+    if max_weight is not None:
+        products = [product for product in products if product.weight <= max_weight]
+    num_products = len(products)
+    if num_products == 0:
+        return [], []
+
+    # 1. dominance: product A dominates product B if A is not bigger (volume) and better (higher value,
+    # or same value and lighter weight). Replacing B by A in a tote gives a better tote, unless A is already
+    # in it. As a tote holds at most max_num products, a product dominated by max_num other products
+    # is never in the best tote.
+    max_num = capacity // min(product.volume for product in products)
+
+    if max_weight is None:
+        dominated = dominated_by_volume(products, max_num)
+    else:
+        # with a weight limit, A must also be not heavier than B, so that the tote stays under the limit
+        min_weight = min(product.weight for product in products)
+        if min_weight > 0:
+            max_num = min(max_num, max_weight // min_weight)
+        dominated = dominated_by_weight(products, max_num)
+
+    products = [product for i, product in enumerate(products) if i not in dominated]
+    logging.info("dominance: removed {} products".format(len(dominated)))
+
+    # 2. LP relaxation: fill the tote in the order of unit price, the first product that doesn't fit is
+    # the break product. The LP bound (the rest of the space filled with a fraction of the break product)
+    # is an upper bound of any tote. With the unit price r of the break product, the LP bound of the totes
+    # with (or without) product j is lower by |value_j - r * volume_j| if the greedy fill doesn't take (or
+    # takes) product j. If that's less than the value of a known tote (the greedy fill), product j can be
+    # fixed out (or in).
+    prefix_volume, prefix_value, b = 0, 0, len(products)
+    for i, product in enumerate(products):
+        if prefix_volume + product.volume > capacity:
+            b = i
+            break
+        prefix_volume += product.volume
+        prefix_value += product.value
+
+    if b == len(products) and (max_weight is None or sum(product.weight for product in products) <= max_weight):
+        # all the candidates fit into the tote
+        fixed, products = products, []
+    elif b == len(products):
+        # all the candidates fit into the tote by volume, but not by weight: no break product
+        fixed = []
+    else:
+        # the lower bound: fill the tote greedily (a known tote, under the weight limit if any), i.e.
+        # continue after the break product if there's no weight limit
+        lower_bound, space, weight_left = 0, capacity, max_weight
+        for product in products:
+            if product.volume <= space and (max_weight is None or product.weight <= weight_left):
+                lower_bound += product.value
+                space -= product.volume
+                if max_weight is not None:
+                    weight_left -= product.weight
+
+        # all the bounds are scaled by the volume of the break product to stay in integers
+        # LP bound = prefix_value + r * (capacity - prefix_volume), r = value_b / volume_b
+        value_b, volume_b = products[b].value, products[b].volume
+        lp_bound = prefix_value * volume_b + value_b * (capacity - prefix_volume)
+        lower_bound *= volume_b
+
+        fixed, remaining = [], []
+        for i, product in enumerate(products):
+            gain = product.value * volume_b - value_b * product.volume  # (value_j - r * volume_j) * volume_b
+            if i < b and lp_bound - gain < lower_bound:
+                fixed.append(product)  # any tote without it is worse than the greedy fill
+            elif i > b and lp_bound + gain < lower_bound:
+                continue  # any tote with it is worse than the greedy fill
+            else:
+                remaining.append(product)
+        products = remaining
+
+    logging.info("LP bounds: fixed {} products in the tote, removed {} products".
+                 format(len(fixed), num_products - len(dominated) - len(fixed) - len(products)))
+
+    fixed_volume = sum(product.volume for product in fixed)
+    logging.info("reduced {} candidates to {} in {:.3f} s, DP size reduced from {} to {} cells ({:.1%})".
+                 format(num_products, len(products), time.perf_counter() - start, num_products * capacity,
+                        len(products) * (capacity - fixed_volume),
+                        1 - len(products) * (capacity - fixed_volume) / (num_products * capacity)))
+
+    return fixed, products
+
+
+# all the engines to find the best products for the tote, see 'engine' above
+solvers = {
+    "table": solve_table,
+    "rolling": solve_rolling,
+    "numpy": solve_numpy,
+    "bnb": solve_branch_and_bound,
+    "hirschberg": solve_hirschberg,
+    "compressed": solve_compressed,
+    "parallel": solve_parallel,
+    "pareto": solve_pareto,
+    "anytime": solve_anytime,
+}
+
+
+def find_best_tote(products, min_volume, capacity=tote_volume, engine_name=engine, max_weight=tote_max_weight,
+                   workers=None, budget=anytime_budget):
+    # find the best tote with the given engine, after reducing the candidates (if b_reduce is set)
+    # max_weight: the weight limit of the tote, only supported by the "pareto" engine
+    # workers: number of worker processes of the "parallel" engine
+    # budget: time budget (seconds) of the "anytime" engine, which doesn't reduce the candidates (the first
+    # tote comes right away, and the upper bounds hold for all the candidates)
+    if max_weight is not None and engine_name != "pareto":
+        logging.info("weight limit = {} - engine {} replaced by pareto".format(max_weight, engine_name))
+        engine_name = "pareto"
+
+    fixed = []
+    if b_reduce and engine_name != "anytime":
+        fixed, products = reduce_candidates(products, capacity, max_weight)
+    elif max_weight is not None:
+        products = [product for product in products if product.weight <= max_weight]
+
+    space = capacity - sum(product.volume for product in fixed)
+    if space < min_volume:
+        # nothing else can fit into the tote
+        found = Basket(space, "TOTE")
+    elif engine_name == "pareto":
+        weight_left = None if max_weight is None else max_weight - sum(product.weight for product in fixed)
+        found = solve_pareto(products, min_volume, space, weight_left)
+    elif engine_name == "parallel":
+        found = solve_parallel(products, min_volume, space, workers)
+    elif engine_name == "anytime":
+        found = solve_anytime(products, min_volume, space, budget)
+    else:
+        found = solvers[engine_name](products, min_volume, space)
+
+    tote = Basket(capacity, "TOTE")
+    for product in fixed + found.items:
+        tote.add_a_product(product)
+
+    logging.info("best total value = {}, weight = {}, ID sum = {}".format(tote.value, tote.weight, tote.id_sum))
+
+    return tote
+
+
+def find_best_totes(products, totes):
+    # find the best tote for each of the tote dimensions, each tote only takes the products that fit into it
+    # products: candidates for any of the totes, sorted by unit price in descending order
+    # returns a list of Baskets, in the same order as totes
+    #
+    # after the DP has processed the first k products, its decisions give the best state of every space
+    # (up to the capacity of the DP) among the first k products. If the products fitting into each tote
+    # come before all the others, one DP at the largest capacity answers all the totes.
+    # That's only possible for a chain of totes, where each tote takes all the products of the previous one
+    # (e.g. bigger in all the dimensions), so the totes are grouped into chains, solved by one DP per chain.
+    fits = [[product.fits(tote) for product in products] for tote in totes]
+
+    chains = []
+    for t in sorted(range(len(totes)), key=lambda t: sum(fits[t])):
+        for chain in chains:
+            if all(fit <= new_fit for fit, new_fit in zip(fits[chain[-1]], fits[t])):
+                chain.append(t)
+                break
+        else:
+            chains.append([t])
+
+    baskets = [None] * len(totes)
+    for chain in chains:
+        # products fitting into the 1st tote, then the products only fitting into the 2nd tote, ...
+        ordered, ends = [], []
+        for k, t in enumerate(chain):
+            ordered += [product for product, fit, previous_fit in
+                        zip(products, fits[t], fits[chain[k - 1]] if k > 0 else [False] * len(products))
+                        if fit and not previous_fit]
+            ends.append(len(ordered))
+
+        capacities = [totes[t][0] * totes[t][1] * totes[t][2] for t in chain]
+        logging.info("one DP for totes {} - {} products, capacity = {}".
+                     format(["{}x{}x{}".format(*totes[t]) for t in chain], len(ordered), max(capacities)))
+        decisions = numpy_decisions(ordered, max(capacities))
+
+        for t, end, capacity in zip(chain, ends, capacities):
+            basket = Basket(capacity, "TOTE {}x{}x{}".format(*totes[t]))
+            for product in follow_decisions(ordered, decisions, end, capacity):
+                basket.add_a_product(product)
+            baskets[t] = basket
+
+    return baskets
+
+
+class Catalog:
+    # the candidate products kept in memory (e.g. by a long running process) between updates of the catalog,
+    # so the best tote is refreshed after some products are added, removed or re-priced, without reading
+    # and sorting the input file again.
+    # The DP rows can't be merged cheaply (merging 2 rows takes capacity^2 steps), so a change is handled by
+    # reducing the candidates and solving the small DP again, which takes a fraction of reading the input file.
+    # And some changes can't change the best tote at all, so nothing is solved again:
+    #   - removing a product not in the tote, or lowering its price: no other tote gets better
+    #   - raising the price of a product in the tote: no other tote gains more
+    def __init__(self, products, dimensions=tote_dimensions, engine_name=engine, max_weight=tote_max_weight):
+        # products: the candidate products, sorted by unit price in descending order (same as process_input()),
+        # only the products fitting into the tote are kept
+        # dimensions: the length, width and height of the tote (cm)
+        self.dimensions = tuple(dimensions)
+        self.capacity = self.dimensions[0] * self.dimensions[1] * self.dimensions[2]
+        self.engine_name = engine_name
+        self.max_weight = max_weight
+        self.products = [product for product in products if product.fits(self.dimensions)]
+        # the sort keys of the products, in the same order, to find the place of a product by bisection
+        self.keys = [self.order(product) for product in self.products]
+        self.by_id = {product.p_id: product for product in self.products}
+        self.tote = None  # the best tote, None if it has to be found again
+
+    @staticmethod
+    def order(product):
+        # same order as products.sort(reverse=True), see Product.__lt__
+        return -product.unit_price, -product.volume, product.weight
+
+    def __insert(self, product):
+        self.remove_product(product.p_id)
+        key = self.order(product)
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.products.insert(i, product)
+        self.by_id[product.p_id] = product
+
+    def __delete(self, product):
+        i = bisect_left(self.keys, self.order(product))
+        while self.products[i] is not product:
+            i += 1
+        del self.keys[i]
+        del self.products[i]
+        del self.by_id[product.p_id]
+
+    def __in_tote(self, p_id):
+        return self.tote is not None and any(product.p_id == p_id for product in self.tote.items)
+
+    def add_product(self, p_id, price, length, width, height, weight):
+        # add a new product, or replace the product with the same ID
+        volume = length * width * height
+        product = Product([p_id, price, length, width, height, weight, volume, price / volume])
+        if not product.fits(self.dimensions):
+            logging.debug("product ID = {} doesn't fit into the tote".format(p_id))
+            self.remove_product(p_id)
+            return
+
+        self.__insert(product)
+        self.tote = None
+
+    def remove_product(self, p_id):
+        product = self.by_id.get(p_id)
+        if product is None:
+            return
+
+        if self.__in_tote(p_id):
+            self.tote = None
+        self.__delete(product)
+
+    def update_price(self, p_id, price):
+        product = self.by_id.get(p_id)
+        if product is None:
+            logging.debug("product ID = {} is not a candidate".format(p_id))
+            return
+
+        # the best tote stays the best if the price of a product in it goes up, or the price of a product
+        # not in it goes down
+        in_tote = self.__in_tote(p_id)
+        b_keep = (price >= product.value) if in_tote else (price <= product.value)
+
+        self.__delete(product)
+        length, width, height = product.dimensions
+        self.__insert(Product([p_id, price, length, width, height, product.weight, product.volume,
+                               price / product.volume]))
+
+        if not b_keep:
+            self.tote = None
+        elif in_tote:
+            # same products, with the new price
+            tote = Basket(self.capacity, self.tote.name)
+            for item in self.tote.items:
+                tote.add_a_product(self.by_id[item.p_id])
+            self.tote = tote
+
+    def best_tote(self):
+        if self.tote is None:
+            if self.products:
+                min_volume = min(product.volume for product in self.products)
+                self.tote = find_best_tote(self.products, min_volume, self.capacity, self.engine_name,
+                                           self.max_weight)
+            else:
+                self.tote = Basket(self.capacity, "TOTE")
+        return self.tote
+
+
+def apply_updates(catalog, csv_file_name):
+    # update the catalog with the changes in a csv file (no header), one change per line:
+    # | product ID | price | length | width | height | weight |  - add a new product (or replace it)
+    # | product ID | price |                                       - re-price a product
+    # | product ID |                                               - remove a product
+    with open(csv_file_name) as csv_file:
+        for line in csv.reader(csv_file):
+            fields = [int(field) for field in line]
+            if len(fields) == 6:
+                catalog.add_product(*fields)
+            elif len(fields) == 2:
+                catalog.update_price(*fields)
+            elif len(fields) == 1:
+                catalog.remove_product(*fields)
+            elif fields:
+                raise Exception("Invalid change in '{}': {}".format(csv_file_name, line))
+
+
+class ToteService:
+    # answers the best tote for a tote size (and optional excluded product IDs), with the candidate products
+    # kept in memory, so a request only solves the DP (of the reduced candidates)
+    # the answers are kept in an LRU cache, keyed on the request (tote dimensions and excluded product IDs)
+    def __init__(self, products, totes=(tote_dimensions,), engine_name=engine, max_weight=tote_max_weight):
+        # products: the candidates for any of the totes, sorted by unit price in descending order
+        # totes: the largest totes answered, a requested tote must fit into one of them
+        self.products = products
+        self.totes = [sorted(tote) for tote in totes]
+        self.engine_name = engine_name
+        self.max_weight = max_weight
+        self.best_tote = lru_cache(maxsize=service_cache_size)(self.__solve)
+
+    def __solve(self, tote, excluded):
+        # tote: (length, width, height), excluded: frozenset of product IDs
+        if not any(all(d <= t for d, t in zip(sorted(tote), largest)) for largest in self.totes):
+            raise Exception("Tote {}x{}x{} is larger than the totes loaded".format(*tote))
+
+        products = [product for product in self.products if product.p_id not in excluded and product.fits(tote)]
+        capacity = tote[0] * tote[1] * tote[2]
+        if not products:
+            return Basket(capacity, "TOTE")
+
+        min_volume = min(product.volume for product in products)
+        return find_best_tote(products, min_volume, capacity, self.engine_name, self.max_weight)
+
+    def request(self, tote, excluded=()):
+        # returns the answer to a request as a dictionary
+        start = time.perf_counter()
+        hits = self.best_tote.cache_info().hits
+        tote = tuple(tote)
+        # the order of the dimensions doesn't matter (see Product.fits())
+        basket = self.best_tote(tuple(sorted(tote)), frozenset(excluded))
+        elapsed = time.perf_counter() - start
+        b_cached = self.best_tote.cache_info().hits > hits
+        logging.info("tote {}x{}x{}, {} excluded - {:.3f} s{}".
+                     format(*tote, len(excluded), elapsed, " (cached)" if b_cached else ""))
+
+        return {"tote": list(tote), "excluded": sorted(excluded), "num_products": basket.num_items,
+                "volume": basket.volume, "value": basket.value, "weight": basket.weight, "id_sum": basket.id_sum,
+                "products": [product.p_id for product in basket.items], "cached": b_cached, "seconds": elapsed}
+
+
+class ToteRequestHandler(BaseHTTPRequestHandler):
+    # GET /tote?size=45,30,35&exclude=1,3,6
+    #   size: length, width and height of the tote (cm), default to the tote in the challenge
+    #   exclude: product IDs not to put into the tote (optional)
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/tote":
+            self.send_error(404)
+            return
+
+        try:
+            query = parse_qs(url.query)
+            tote = [int(d) for d in query["size"][0].split(",")] if "size" in query else list(tote_dimensions)
+            excluded = [int(p_id) for ids in query.get("exclude", []) for p_id in ids.split(",") if p_id]
+            if len(tote) != 3:
+                raise Exception("size must be length,width,height")
+            answer = self.server.service.request(tote, excluded)
+        except Exception as error:
+            self.send_error(400, str(error))
+            return
+
+        body = json.dumps(answer).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def serve(service, port, host="127.0.0.1"):
+    # answer the requests on a local port until interrupted (Ctrl+C)
+    server = HTTPServer((host, port), ToteRequestHandler)
+    server.service = service
+    logging.info("serving on http://{}:{}/tote?size=45,30,35&exclude=1,3".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the products for the tote(s) with the highest total value.")
+    parser.add_argument("csv_file", nargs="?", default="./products.csv", help="the input file of products")
+    parser.add_argument("--engine", choices=sorted(solvers), default=engine, help="the engine to find the best tote")
+    parser.add_argument("--cache", action="store_true", default=b_cache,
+                        help="keep the candidate products in a cache file next to the input file")
+    parser.add_argument("--tote", nargs=3, type=int, action="append", metavar=("L", "W", "H"),
+                        help="dimensions of a tote (cm), repeat to find the best products for several totes")
+    parser.add_argument("--workers", type=int, default=num_workers,
+                        help="number of worker processes of the parallel engine (default: number of CPU cores)")
+    parser.add_argument("--budget", type=float, default=anytime_budget,
+                        help="time budget (seconds) of the anytime engine")
+    parser.add_argument("--max-weight", type=int, default=tote_max_weight,
+                        help="the weight limit of the tote (gram), solved by the pareto engine")
+    parser.add_argument("--serve", type=int, metavar="PORT",
+                        help="keep running as a local HTTP service, the largest totes answered are given by --tote")
+    parser.add_argument("--updates", nargs="+", metavar="CSV_FILE",
+                        help="files of changes to the catalog, the best tote is refreshed after each file")
+    args = parser.parse_args()
+
+    if args.serve:
+        totes = [tuple(tote) for tote in args.tote] if args.tote else [tote_dimensions]
+        products, min_volume = process_input(args.csv_file, args.cache, totes)
+        serve(ToteService(products, totes, args.engine, args.max_weight), args.serve)
+        return
+
+    if args.tote:
+        if args.max_weight is not None:
+            raise Exception("--max-weight is not supported with --tote")
+
+        # several totes, solved together (one DP for each chain of totes)
+        totes = [tuple(tote) for tote in args.tote]
+        products, min_volume = process_input(args.csv_file, args.cache, totes)
+        for tote in find_best_totes(products, totes):
+            print(tote)
+        return
+
+    # without weight limit or updates, the dominated products are dropped while reading the input file
+    b_filter = b_reduce and args.max_weight is None and not args.updates
+    products, min_volume = process_input(args.csv_file, args.cache, b_filter=b_filter)
+
+    max_num = tote_volume//min_volume
+    logging.info("max number of products in the tote = {}".format(max_num))
+
+    # write_to_csv(products, len(products)-1)
+
+    if args.updates:
+        # keep the catalog in memory, and refresh the best tote after each file of changes
+        catalog = Catalog(products, engine_name=args.engine, max_weight=args.max_weight)
+        print(catalog.best_tote())
+        for file_name in args.updates:
+            start = time.perf_counter()
+            apply_updates(catalog, file_name)
+            tote = catalog.best_tote()
+            logging.info("'{}' - refreshed in {:.3f} s".format(file_name, time.perf_counter() - start))
+            print(tote)
+        return
+
+    tote = find_best_tote(products, min_volume, engine_name=args.engine, max_weight=args.max_weight,
+                          workers=args.workers, budget=args.budget)
+
     print(tote)
     # tote.print_content()  # to print details of content in the tote
 
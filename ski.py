@@ -1,7 +1,45 @@
+import argparse
+import glob
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
 import logging
 # change logging level from INFO to DEBUG to print debugging logs
 logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(funcName)s - %(lineno)d - %(message)s')
 
+# all the heights on the Map are between 0 and 1500
+max_height = 1500
+
+# the engine used to solve the Map:
+#   "recursive" - depth-first search from every Area (limited by the recursion limit of Python)
+#   "iterative" - visit Areas in ascending order of height, without recursion
+#   "numpy"     - same order as "iterative", but all the Areas of the same height are updated at once
+#   "tiled"     - split the Map into tiles and solve them with the "numpy" engine in parallel processes
+#   "mmap"      - same as "numpy", but the Map and the results are kept in memory-mapped files (out-of-core)
+engine = "numpy"
+
+# the number of Areas processed at a time when scanning the Map in chunks (e.g. by the "mmap" engine)
+chunk_size = 1 << 20
+
+# the settings of the "tiled" engine: the number of worker processes (None: number of CPUs)
+# and the size of the tiles (tile_size x tile_size Areas)
+num_workers = None
+tile_size = 1000
+
+# keep the parsed heights in a binary cache file next to the input file (e.g. "map.txt.npz")
+b_cache = False
+
+# the numpy engine packs path length and bottom height of an Area into a single integer:
+#   key = path_length * 2 ** key_shift + (max_key_height - bottom_height)
+# so a single max() picks the longer path and breaks tie with the lower bottom height,
+# i.e. the same rule as Area.update_parameters
+key_shift = 11  # 2 ** 11 > max_height
+max_key_height = 2 ** key_shift - 1
+
 
 class Area:
     # an Area is a point on the Map
@@ -42,124 +80,728 @@ class Area:
             self.bottom_height = min(new_bottom, self.bottom_height)
 
 
-def prepare_map(file_name):
-    # parse input file to get the height of each Area
-    logging.info("Input File: \"./{}\"".format(file_name))
-
-    # open the input file for reading
-    file = open(file_name, "r")
+class SkiMap:
+    # a compact representation of the Map, backed by typed arrays instead of one Area object per point
+    # all the arrays are flattened in row-major order, i.e. Area (x, y) is at index x * column + y
+    def __init__(self, heights, path_length=None, bottom_height=None, successor=None):
+        # heights: 2D array (row x column) of the heights on the Map, copied so that editing the Map (see
+        # update_heights()) never changes the caller's array. Memory-mapped heights are used in place.
+        # path_length, bottom_height, successor: arrays (row x column) to keep the results in, e.g. memory-mapped
+        # files, already initialised to the default values below. New arrays are created if not given.
+        self.row, self.column = heights.shape
+        self.size = self.row * self.column
 
-    # the 1st line of the input file indicates the size of the map (row and column)
-    row, column = map(int, file.readline().strip().split(" "))
+        if isinstance(heights, np.memmap):
+            self.heights = heights.ravel()
+        else:
+            self.heights = np.array(heights, dtype=np.uint16).ravel()
+
+        # same meaning and default values as in Area:
+        # path_length '0' and bottom_height '-1' indicate that the Area hasn't been visited
+        self.path_length = np.zeros(self.size, dtype=np.int32) if path_length is None else path_length.ravel()
+        self.bottom_height = np.full(self.size, -1, dtype=np.int16) if bottom_height is None \
+            else bottom_height.ravel()
+
+        # successor: the direction (index into offsets) of the next Area on the longest path from an Area
+        # the default value '-1' indicates that the path ends at the Area (or it hasn't been visited)
+        self.successor = np.full(self.size, -1, dtype=np.int8) if successor is None else successor.ravel()
+
+        # offsets of the neighbours in the flattened arrays, in clockwise order: N -> E -> S -> W
+        self.offsets = (-self.column, 1, self.column, -1)
+
+    def neighbours(self, cells):
+        # for each direction (N -> E -> S -> W), return a mask of the cells which have a neighbour
+        # in that direction, together with the offset of the neighbour
+        x, y = np.divmod(cells, self.column)
+        valid = (x > 0, y < self.column - 1, x < self.row - 1, y > 0)
+
+        return zip(valid, self.offsets)
+
+    def area(self, x, y):
+        # a lightweight Area view of the point (x, y), e.g. for debugging output
+        i = x * self.column + y
+        area = Area(x, y, int(self.heights[i]))
+        area.path_length = int(self.path_length[i])
+        area.bottom_height = int(self.bottom_height[i])
+        area.b_visited = area.path_length > 0
+
+        return area
+
+    def areas(self):
+        # Area views of all the points on the Map, in row-major order
+        for x in range(self.row):
+            for y in range(self.column):
+                yield self.area(x, y)
+
+    def best_start(self):
+        # the location (x, y) of the start of the longest path, break tie with larger drop
+        # scan the Map in chunks to keep the temporary arrays small
+        best, i = -1, 0
+        for start in range(0, self.size, chunk_size):
+            stop = min(start + chunk_size, self.size)
+            drop = self.heights[start:stop].astype(np.int32) - self.bottom_height[start:stop]
+            keys = (self.path_length[start:stop].astype(np.int64) << key_shift) + drop
+            j = int(np.argmax(keys))
+            if keys[j] > best:
+                best, i = keys[j], start + j
+
+        return divmod(i, self.column)
+
+    def path(self, x, y):
+        # walk the longest (and then steepest) path starting from Area (x, y) by following the successors
+        # returns a list of (x, y, height) of all the Areas on the path
+        i = x * self.column + y
+        path = [(x, y, int(self.heights[i]))]
+
+        while self.successor[i] >= 0:
+            i += self.offsets[self.successor[i]]
+            path.append(divmod(i, self.column) + (int(self.heights[i]),))
+
+        return path
+
+
+def parse_rows(text, row, column, first_row=0):
+    # parse 'row' lines of the map in bulk, starting from the row 'first_row' of the map
+    # text: the lines as an array of bytes
+
+    # only the next 'row' lines of the input file belong to the map, ignore anything after them
+    line_ends = np.flatnonzero(text == ord("\n"))
+    if line_ends.size >= row:
+        text = text[:line_ends[row - 1] if row > 0 else 0]
+        line_ends = line_ends[:row - 1]
+    line_starts = np.concatenate(([0], line_ends + 1))[:row]
+
+    # only digits, minus signs and white spaces are allowed
+    space = (text == ord(" ")) | (text == ord("\n")) | (text == ord("\r")) | (text == ord("\t"))
+    invalid = ~space & ((text < ord("0")) | (text > ord("9"))) & (text != ord("-"))
+    if invalid.any():
+        i = np.searchsorted(line_starts, np.argmax(invalid), side="right") - 1
+        raise Exception("Line {} of input file has invalid values.".format(first_row + i + 2))
+
+    # count the values on each line: a value starts where a non-space character follows a space
+    starts = ~space & np.concatenate(([True], space[:-1]))
+    counts = np.zeros(row, dtype=np.int64)
+    # a line starting at the end of the text (e.g. after the last line break) has no value
+    not_empty = line_starts < text.size
+    counts[:line_starts.size][not_empty] = np.add.reduceat(starts, line_starts[not_empty], dtype=np.int64)
+    bad_lines = np.flatnonzero(counts != column)
+    if bad_lines.size > 0:
+        raise Exception("Line {} of input file has incorrect no. of values.".format(first_row + bad_lines[0] + 2))
+
+    heights = np.fromstring(text.tobytes(), dtype=np.int64, sep=" ").reshape(row, column)
+
+    # range check for height -> [0, 1500]
+    out_of_range = (heights < 0) | (heights > max_height)
+    if out_of_range.any():
+        i, j = np.argwhere(out_of_range)[0]
+        raise Exception("Area({}, {}) - Height = {} is out of range".format(first_row + i, j, heights[i, j]))
+
+    return heights.astype(np.uint16)
+
+
+def parse_map(file_name):
+    # read the whole input file at once and parse all the heights in bulk
+    with open(file_name, "rb") as file:
+        # the 1st line of the input file indicates the size of the map (row and column)
+        row, column = map(int, file.readline().strip().split(b" "))
+        text = np.frombuffer(file.read(), dtype=np.uint8)
 
     logging.info("Map Size: row = {}, column = {}".format(row, column))
 
-    # ski_map is a list of lists where each entry is an Area object
-    # the indexes of the entry denotes the location on the map
-    # i.e. area = ski_map[i][j] ==> area.x = i; area.y = j
-    ski_map = []
+    return parse_rows(text, row, column)
+
 
-    for i in range(row):
-        input_row = list(map(int, file.readline().strip().split(" ")))
+def prepare_map(file_name, b_cache=False):
+    # parse input file to get the height of each Area
+    # b_cache: keep the parsed heights in a binary file next to the input file (e.g. "map.txt.npz"),
+    # so the next run on the same (i.e. same size and modification time) input file skips the parsing
+    logging.info("Input File: \"./{}\"".format(file_name))
 
-        if len(input_row) != column:
-            raise Exception("Line {} of input file has incorrect no. of values.".format(i + 2))
+    cache_name = file_name + ".npz"
+    stat = os.stat(file_name)
+    key = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
 
-        area_row = []
-        for j in range(column):
-            # range check for height -> [0, 1500]
-            if input_row[j] < 0 or input_row[j] > 1500:
-                raise Exception("Area({}, {}) - Height = {} is out of range".format(i, j, input_row[j]))
-            area_row.append(Area(i, j, input_row[j]))
+    heights = None
+    if b_cache and os.path.exists(cache_name):
+        with np.load(cache_name) as cache:
+            if np.array_equal(cache["key"], key):
+                heights = cache["heights"]
+                logging.info("Loaded heights from cache: \"./{}\"".format(cache_name))
 
-        ski_map.append(area_row)
+    if heights is None:
+        heights = parse_map(file_name)
 
-    file.close()
+        if b_cache:
+            # write to a temporary file first, so an interrupted run never leaves a broken cache behind
+            with open(cache_name + ".tmp", "wb") as cache:
+                np.savez(cache, heights=heights, key=key)
+            os.replace(cache_name + ".tmp", cache_name)
 
-    return ski_map, row, column
+    # ski_map keeps the heights, path lengths and bottom heights of all the Areas in typed arrays
+    # i.e. area = ski_map.area(i, j) ==> area.x = i; area.y = j
+    return SkiMap(heights)
 
 
-def main():
-    def visit_area(area):
+def solve_recursive(ski_map):
+    # plain lists are much faster than numpy arrays for element-wise access
+    heights = ski_map.heights.tolist()
+    path_length = ski_map.path_length.tolist()
+    bottom_height = ski_map.bottom_height.tolist()
+    successor = ski_map.successor.tolist()
+    row, column = ski_map.row, ski_map.column
+
+    def visit_area(i):
 
-        def compare_with_neighbour(area, neighbour):
-            # update path_length and bottom_height of current area after comparing with neighbour area
-            if area.height <= neighbour.height:
+        def compare_with_neighbour(i, j):
+            # return path_length and bottom_height of the path going from area i to neighbour area j
+            if heights[i] <= heights[j]:
                 # the base case:
                 # the new path length is '1' (the current area itself)
                 # the new bottom height is the height of the current area itself
-                area.update_parameters(1, area.height)
-            else:
-                visit_area(neighbour)   # recursive call
-                new_length = neighbour.path_length + 1
-                new_bottom = neighbour.bottom_height
-                area.update_parameters(new_length, new_bottom)
+                return 1, heights[i]
+
+            visit_area(j)   # recursive call
+            return path_length[j] + 1, bottom_height[j]
 
         # if an Area has already been visited, the parameters are up-to-date
-        if area.b_visited:
+        if path_length[i] > 0:
             return
 
+        x, y = divmod(i, column)
+
+        # the base case: the path that only contains the current area itself
+        length, bottom, direction = 1, heights[i], -1
+
         # start to visit neighbours in clockwise order: N -> E -> S -> W
-        # 1. North
-        if area.x == 0:  # there's no neighbour to the North of current area -> the base case
-            area.update_parameters(1, area.height)
-        else:
-            neighbour = ski_map[area.x - 1][area.y]
-            compare_with_neighbour(area, neighbour)
+        neighbours = ((x > 0, i - column), (y < column - 1, i + 1), (x < row - 1, i + column), (y > 0, i - 1))
+        for d, (valid, j) in enumerate(neighbours):
+            if valid:
+                new_length, new_bottom = compare_with_neighbour(i, j)
 
-        # 2. East
-        if area.y == (column - 1):  # there's no neighbour to the East of current area -> the base case
-            area.update_parameters(1, area.height)
-        else:
-            neighbour = ski_map[area.x][area.y + 1]
-            compare_with_neighbour(area, neighbour)
+                # same rule as Area.update_parameters, the successor is the first neighbour of the best path
+                if length < new_length or (length == new_length and new_bottom < bottom):
+                    length, bottom, direction = new_length, new_bottom, d
 
-        # 3. South
-        if area.x == (row - 1):  # there's no neighbour to the South of current area -> the base case
-            area.update_parameters(1, area.height)
-        else:
-            neighbour = ski_map[area.x + 1][area.y]
-            compare_with_neighbour(area, neighbour)
+        # all neighbours have been visited, the current area has been updated/visited as well
+        path_length[i] = length
+        bottom_height[i] = bottom
+        successor[i] = direction
+
+    for i in range(ski_map.size):
+        visit_area(i)
+
+    ski_map.path_length[:] = path_length
+    ski_map.bottom_height[:] = bottom_height
+    ski_map.successor[:] = successor
+
+
+def solve_iterative(ski_map):
+    # a path can only go downhill, so the path length and bottom height of an Area only depend on
+    # its lower neighbours. By visiting the Areas in ascending order of height, all the lower
+    # neighbours of an Area are already up-to-date when the Area is visited -> no recursion needed.
+    heights = ski_map.heights.tolist()
+    path_length = ski_map.path_length.tolist()
+    bottom_height = ski_map.bottom_height.tolist()
+    successor = ski_map.successor.tolist()
+    row, column = ski_map.row, ski_map.column
+
+    # heights are bounded to [0, max_height]: a bucket sort puts the Areas in order in linear time
+    buckets = [[] for _ in range(max_height + 1)]
+    for i, height in enumerate(heights):
+        buckets[height].append(i)
+
+    for bucket in buckets:
+        for i in bucket:
+            x, y = divmod(i, column)
+            height = heights[i]
+
+            # the base case: the path that only contains the current area itself
+            length, bottom, direction = 1, height, -1
+
+            # visit neighbours in clockwise order: N -> E -> S -> W
+            neighbours = ((x > 0, i - column), (y < column - 1, i + 1), (x < row - 1, i + column), (y > 0, i - 1))
+            for d, (valid, j) in enumerate(neighbours):
+                if valid and heights[j] < height:
+                    new_length, new_bottom = path_length[j] + 1, bottom_height[j]
+
+                    # same rule as Area.update_parameters, the successor is the first neighbour of the best path
+                    if length < new_length or (length == new_length and new_bottom < bottom):
+                        length, bottom, direction = new_length, new_bottom, d
+
+            path_length[i] = length
+            bottom_height[i] = bottom
+            successor[i] = direction
+
+    ski_map.path_length[:] = path_length
+    ski_map.bottom_height[:] = bottom_height
+    ski_map.successor[:] = successor
+
+
+def update_levels(ski_map, cells):
+    # update the Areas at 'cells' (indices in the flattened arrays) in ascending order of height
+    # all the other Areas are assumed to be up-to-date already, Areas that haven't been visited are ignored
+    heights = ski_map.heights
+
+    # sort the Areas by height, a stable sort of small integers is a radix (bucket) sort in numpy
+    cell_heights = heights[cells]
+    order = np.argsort(cell_heights, kind="stable")
+    bounds = np.searchsorted(cell_heights[order], np.arange(max_height + 2))
+    order = cells[order]
+
+    for height in np.flatnonzero(np.diff(bounds)):
+        update_level(ski_map, order[bounds[height]:bounds[height + 1]], height)
+
+
+def update_level(ski_map, cells, height):
+    # update the Areas at 'cells', which are all of the same height
+    # Areas of the same height can't go to each other, so all of them only depend on lower Areas
+    # which have been visited already -> update the whole level at once
+    heights = ski_map.heights
+
+    # the base case: the path that only contains the current Area itself
+    best = np.full(cells.size, (1 << key_shift) + max_key_height - height, dtype=np.int32)
+    successor = np.full(cells.size, -1, dtype=np.int8)
+
+    # compare with neighbours in clockwise order: N -> E -> S -> W
+    for direction, (valid, offset) in enumerate(ski_map.neighbours(cells)):
+        neighbours = cells[valid] + offset
+        lower = (heights[neighbours] < height) & (ski_map.path_length[neighbours] > 0)
+        # one more step from a lower neighbour: path length + 1, same bottom height
+        candidates = ((ski_map.path_length[neighbours] + 1) << key_shift) + \
+            (max_key_height - ski_map.bottom_height[neighbours])
+        candidates = np.where(lower, candidates, 0)
+
+        # the successor is the first neighbour of the best path
+        better = np.flatnonzero(valid)[candidates > best[valid]]
+        best[better] = candidates[candidates > best[valid]]
+        successor[better] = direction
+
+    ski_map.path_length[cells] = best >> key_shift
+    ski_map.bottom_height[cells] = max_key_height - (best & max_key_height)
+    ski_map.successor[cells] = successor
+
+
+def solve_numpy(ski_map):
+    update_levels(ski_map, np.arange(ski_map.size))
+
+
+def prepare_map_out_of_core(file_name, work_dir):
+    # parse input file into memory-mapped files in 'work_dir', chunk by chunk, so the Map never has to
+    # fit into memory. The results (path length, bottom height, successor) are memory-mapped as well.
+    logging.info("Input File: \"./{}\", working directory: \"./{}\"".format(file_name, work_dir))
+    os.makedirs(work_dir, exist_ok=True)
+
+    def open_array(name, dtype, shape):
+        return np.lib.format.open_memmap(os.path.join(work_dir, name + ".npy"), mode="w+", dtype=dtype, shape=shape)
+
+    with open(file_name, "rb") as file:
+        # the 1st line of the input file indicates the size of the map (row and column)
+        row, column = map(int, file.readline().strip().split(b" "))
+        logging.info("Map Size: row = {}, column = {}".format(row, column))
+
+        heights = open_array("heights", np.uint16, (row, column))
+        rows_per_chunk = max(1, chunk_size // max(column, 1))
+        for first_row in range(0, row, rows_per_chunk):
+            num_rows = min(rows_per_chunk, row - first_row)
+            text = np.frombuffer(b"".join(itertools.islice(file, num_rows)), dtype=np.uint8)
+            heights[first_row:first_row + num_rows] = parse_rows(text, num_rows, column, first_row)
+
+    path_length = open_array("path_length", np.int32, (row, column))  # a new file is filled with '0'
+    bottom_height = open_array("bottom_height", np.int16, (row, column))
+    successor = open_array("successor", np.int8, (row, column))
+    for first_row in range(0, row, rows_per_chunk):
+        bottom_height[first_row:first_row + rows_per_chunk] = -1
+        successor[first_row:first_row + rows_per_chunk] = -1
+
+    return SkiMap(heights, path_length, bottom_height, successor)
+
+
+def solve_out_of_core(ski_map, work_dir):
+    # same as the "numpy" engine, but never holds more than chunk_size Areas in memory at a time
+    # (plus the pages of the memory-mapped files cached by the OS, which can be reclaimed at any time)
+    heights = ski_map.heights
+
+    # counting sort of the Areas by height into a memory-mapped file, chunk by chunk
+    # 1st pass: count the Areas of each height -> the range of each height in the sorted order
+    counts = np.zeros(max_height + 1, dtype=np.int64)
+    for start in range(0, ski_map.size, chunk_size):
+        counts += np.bincount(heights[start:start + chunk_size], minlength=max_height + 1)
+    bounds = np.concatenate(([0], np.cumsum(counts)))
+
+    # 2nd pass: put the Areas of each chunk to the next free places in the ranges of their heights
+    order = np.lib.format.open_memmap(os.path.join(work_dir, "order.npy"), mode="w+",
+                                      dtype=np.int64, shape=(ski_map.size,))
+    next_free = bounds[:-1].copy()
+    for start in range(0, ski_map.size, chunk_size):
+        chunk = heights[start:start + chunk_size]
+        chunk_order = np.argsort(chunk, kind="stable")
+        chunk_counts = np.bincount(chunk, minlength=max_height + 1)
+        sorted_heights = chunk[chunk_order]
+        # rank of each Area among the Areas of the same height in the chunk
+        ranks = np.arange(chunk.size) - (np.cumsum(chunk_counts) - chunk_counts)[sorted_heights]
+        order[next_free[sorted_heights] + ranks] = start + chunk_order
+        next_free += chunk_counts
+
+    # the Areas of the same height are independent of each other, so a large level can be updated in chunks
+    for height in np.flatnonzero(counts):
+        for start in range(bounds[height], bounds[height + 1], chunk_size):
+            stop = min(start + chunk_size, bounds[height + 1])
+            update_level(ski_map, np.array(order[start:stop]), height)
+
+    del order
+    os.remove(os.path.join(work_dir, "order.npy"))
+
+    for array in (ski_map.path_length, ski_map.bottom_height, ski_map.successor):
+        array.flush()
+
+
+def find_uphill(ski_map, frontier, inside=None):
+    # mark the Areas at 'frontier' (indices in the flattened arrays) and all the Areas that can go down to
+    # any of them, i.e. everything uphill of them. The search doesn't go beyond the Areas marked by 'inside'.
+    affected = np.zeros(ski_map.size, dtype=bool)
+    frontier = np.unique(frontier)
+    affected[frontier] = True
+    while frontier.size > 0:
+        uphill = []
+        for valid, offset in ski_map.neighbours(frontier):
+            neighbours = frontier[valid] + offset
+            higher = ski_map.heights[neighbours] > ski_map.heights[frontier[valid]]
+            if inside is not None:
+                higher &= inside[neighbours]
+            uphill.append(neighbours[higher & ~affected[neighbours]])
+        frontier = np.unique(np.concatenate(uphill))
+        affected[frontier] = True
+
+    return affected
+
+
+def solve_tile(heights):
+    # solve a tile of the Map on its own, run in a worker process of solve_tiled()
+    # heights: 2D array of the heights of the tile
+    start = time.perf_counter()
+
+    tile = SkiMap(heights)
+    solve_numpy(tile)
+
+    return tile.path_length.reshape(heights.shape), tile.bottom_height.reshape(heights.shape), \
+        tile.successor.reshape(heights.shape), time.perf_counter() - start
+
+
+def solve_tiled(ski_map, workers=None, size=None):
+    # split the Map into tiles of size x size Areas and solve the tiles in a pool of worker processes
+    # each tile is solved on its own, as if the paths couldn't cross the borders of the tiles. The results of
+    # an Area are still exact if none of the Areas it can go down to has a lower neighbour in another tile, so
+    # only the Areas uphill of such a crossing are solved again on the whole Map (same as update_heights()),
+    # which gives identical results to the serial engines
+    workers = workers or num_workers or os.cpu_count()
+    size = size or tile_size
+    row, column = ski_map.row, ski_map.column
+
+    heights = ski_map.heights.reshape(row, column)
+    path_length = ski_map.path_length.reshape(row, column)
+    bottom_height = ski_map.bottom_height.reshape(row, column)
+    successor = ski_map.successor.reshape(row, column)
+
+    tiles = [(i, j) for i in range(0, row, size) for j in range(0, column, size)]
+    logging.info("Map Size: row = {}, column = {}, tile size = {}, no. of tiles = {}, workers = {}".
+                 format(row, column, size, len(tiles), workers))
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(solve_tile, heights[i:i + size, j:j + size]): (i, j) for i, j in tiles}
+
+        for future in as_completed(futures):
+            i, j = futures[future]
+            new_length, new_bottom, new_successor, elapsed = future.result()
+            logging.info("Tile ({}, {}) - rows [{}, {}), columns [{}, {}) solved in {:.3f} s".
+                         format(i // size, j // size, i, i + new_length.shape[0], j, j + new_length.shape[1], elapsed))
+
+            path_length[i:i + size, j:j + size] = new_length
+            bottom_height[i:i + size, j:j + size] = new_bottom
+            successor[i:i + size, j:j + size] = new_successor
+
+    # the Areas with a lower neighbour across a border between two tiles, on both sides of each border
+    index = np.arange(ski_map.size).reshape(row, column)
+    crossings = []
+    for k in range(size, row, size):
+        above, below = heights[k - 1].astype(np.int32), heights[k].astype(np.int32)
+        crossings += [index[k - 1][below < above], index[k][above < below]]
+    for k in range(size, column, size):
+        left, right = heights[:, k - 1].astype(np.int32), heights[:, k].astype(np.int32)
+        crossings += [index[:, k - 1][right < left], index[:, k][left < right]]
+
+    if crossings:
+        start = time.perf_counter()
+        cells = np.flatnonzero(find_uphill(ski_map, np.concatenate(crossings)))
+        ski_map.path_length[cells] = 0
+        ski_map.bottom_height[cells] = -1
+        ski_map.successor[cells] = -1
+        update_levels(ski_map, cells)
+        logging.info("{} Areas across the borders of the tiles solved again in {:.3f} s".
+                     format(cells.size, time.perf_counter() - start))
+
+
+def find_max_path(ski_map):
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        for area in ski_map.areas():
+            logging.debug(area)
+
+    # the longest path, break tie with larger drop
+    # the max_drop is not the maximum drop on the map, it's the drop of the path with max_length
+    area = ski_map.area(*ski_map.best_start())
+    max_length, max_drop = area.path_length, area.height - area.bottom_height
+
+    return max_length, max_drop
+
+
+def update_heights(ski_map, edits):
+    # change the heights of a few Areas on a solved Map and solve again only the Areas that can be affected
+    # edits: a list of (x, y, new_height)
+    # returns the max length and drop of the updated Map, same as find_max_path()
+    # check all the edits before changing any height, so a bad edit leaves the Map as it was
+    for x, y, height in edits:
+        if not (0 <= x < ski_map.row and 0 <= y < ski_map.column):
+            raise Exception("Area({}, {}) is not on the map".format(x, y))
+        if height < 0 or height > max_height:
+            raise Exception("Area({}, {}) - Height = {} is out of range".format(x, y, height))
+
+    edited = []
+    for x, y, height in edits:
+        ski_map.heights[x * ski_map.column + y] = height
+        edited.append(x * ski_map.column + y)
+
+    # the paths can only change at the edited Areas and their neighbours, e.g. a neighbour which used to go
+    # down to an edited Area may not be able to do so anymore
+    edited = np.array(edited, dtype=np.int64)
+    seeds = [edited] + [edited[valid] + offset for valid, offset in ski_map.neighbours(edited)]
+
+    # ... and at all the Areas that can go down to any of them, i.e. everything uphill of them
+    affected = find_uphill(ski_map, np.concatenate(seeds))
+
+    cells = np.flatnonzero(affected)
+    logging.info("{} edits, {} Areas to solve again".format(len(edits), cells.size))
+
+    # solve the affected Areas again, all the other Areas are still up-to-date
+    ski_map.path_length[cells] = 0
+    ski_map.bottom_height[cells] = -1
+    ski_map.successor[cells] = -1
+    update_levels(ski_map, cells)
+
+    return find_max_path(ski_map)
+
+
+def print_path(ski_map, x, y):
+    path = ski_map.path(x, y)
+    print("Path from Area ({}, {}): length = {}, drop = {}, heights = {}".
+          format(x, y, len(path), path[0][2] - path[-1][2], "-".join(str(area[2]) for area in path)))
+    for i, (x, y, height) in enumerate(path):
+        print("{} - Area ({}, {}) - Height={}".format(i + 1, x, y, height))
+
+
+def save_results(ski_map, directory):
+    # save the path length and the drop of every Area as rasters (row x column) in the .npy format,
+    # which can be memory-mapped by SkiResults to answer queries without solving the Map again
+    os.makedirs(directory, exist_ok=True)
+
+    def open_raster(name, dtype):
+        return np.lib.format.open_memmap(os.path.join(directory, name + ".npy"), mode="w+",
+                                         dtype=dtype, shape=(ski_map.row, ski_map.column))
+
+    length, drop = open_raster("length", np.int32), open_raster("drop", np.int16)
+    length_flat, drop_flat = length.reshape(-1), drop.reshape(-1)
+    for start in range(0, ski_map.size, chunk_size):
+        stop = min(start + chunk_size, ski_map.size)
+        length_flat[start:stop] = ski_map.path_length[start:stop]
+        drop_flat[start:stop] = ski_map.heights[start:stop] - ski_map.bottom_height[start:stop]
+    length.flush()
+    drop.flush()
+
+    logging.info("Saved results to \"./{}\"".format(directory))
+
+
+class SkiResults:
+    # queries on the per-Area results of a solved Map, saved by save_results()
+    # the rasters are memory-mapped, i.e. only the parts of them used by a query are loaded from disk
+    def __init__(self, directory):
+        self.length = np.load(os.path.join(directory, "length.npy"), mmap_mode="r")
+        self.drop = np.load(os.path.join(directory, "drop.npy"), mmap_mode="r")
+        self.row, self.column = self.length.shape
+
+    def lookup(self, x, y):
+        # the length and drop of the longest (and then steepest) path starting from Area (x, y)
+        return int(self.length[x, y]), int(self.drop[x, y])
+
+    def top(self, k):
+        # the k best start Areas by length and then drop, as a list of (x, y, length, drop)
+        # scan the rasters in chunks of rows, keep the best k Areas of each chunk as candidates
+        best_keys, best_cells = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        rows_per_chunk = max(1, chunk_size // max(self.column, 1))
+        for first_row in range(0, self.row, rows_per_chunk):
+            rows = slice(first_row, first_row + rows_per_chunk)
+            keys = ((self.length[rows].astype(np.int64) << key_shift) + self.drop[rows]).ravel()
+            cells = np.arange(keys.size) + first_row * self.column
+            if keys.size > k:
+                # the Areas better than the k-th best one, plus the first Areas tied with it
+                kth = np.partition(keys, keys.size - k)[keys.size - k]
+                better = np.flatnonzero(keys > kth)
+                candidates = np.concatenate((better, np.flatnonzero(keys == kth)[:k - better.size]))
+                keys, cells = keys[candidates], cells[candidates]
+            best_keys, best_cells = np.append(best_keys, keys), np.append(best_cells, cells)
+
+        # sort by key in descending order, break tie with the location on the Map
+        best = np.lexsort((best_cells, -best_keys))[:k]
+
+        return [divmod(int(i), self.column) + self.lookup(*divmod(int(i), self.column)) for i in best_cells[best]]
+
+    def best_in_region(self, x1, y1, x2, y2):
+        # the best start Area within the rectangle from Area (x1, y1) to Area (x2, y2) (both included)
+        # returns (x, y, length, drop)
+        if not (0 <= x1 <= x2 < self.row and 0 <= y1 <= y2 < self.column):
+            raise Exception("Region ({}, {}) - ({}, {}) is not on the map".format(x1, y1, x2, y2))
+
+        region = (slice(x1, x2 + 1), slice(y1, y2 + 1))
+        keys = (self.length[region].astype(np.int64) << key_shift) + self.drop[region]
+        x, y = np.unravel_index(np.argmax(keys), keys.shape)
+
+        return (x1 + int(x), y1 + int(y)) + self.lookup(x1 + x, y1 + y)
+
+
+def query_results(args):
+    results = SkiResults(args.results)
+    logging.info("Results of a map with row = {}, column = {}".format(results.row, results.column))
+
+    if args.top:
+        for i, (x, y, length, drop) in enumerate(results.top(args.top)):
+            print("{} - Area ({}, {}) - Path Length={}, Drop={}".format(i + 1, x, y, length, drop))
+
+    if args.region:
+        x, y, length, drop = results.best_in_region(*args.region)
+        print("Best in region {}: Area ({}, {}) - Path Length={}, Drop={}".
+              format(tuple(args.region), x, y, length, drop))
+
+    for x, y in args.lookup:
+        length, drop = results.lookup(x, y)
+        print("Area ({}, {}) - Path Length={}, Drop={}".format(x, y, length, drop))
+
+
+# all the engines to solve the Map, see 'engine' above
+solvers = {
+    "recursive": solve_recursive,
+    "iterative": solve_iterative,
+    "numpy": solve_numpy,
+    "tiled": solve_tiled,
+    "mmap": solve_out_of_core,
+}
+
+
+def solve_file(file_name, engine_name):
+    # solve a single map in a worker process of solve_batch()
+    # returns the max length and drop, and the time spent on the map (including parsing)
+    start = time.perf_counter()
+    ski_map = prepare_map(file_name)
+    solvers[engine_name](ski_map)
+    max_length, max_drop = find_max_path(ski_map)
+
+    return max_length, max_drop, time.perf_counter() - start
+
+
+def solve_batch(pattern, workers=None, engine_name=engine):
+    # solve all the maps matching 'pattern' (a directory, a file name or a glob pattern, e.g. "maps/*.txt")
+    # in a pool of worker processes, and print the results of each map as soon as it's solved
+    if engine_name in ("tiled", "mmap"):
+        raise Exception("Engine \"{}\" can't be used in batch mode".format(engine_name))
+
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.txt")
+    file_names = sorted(glob.glob(pattern))
+    workers = workers or num_workers or os.cpu_count()
+    logging.info("Batch: {} maps, engine = {}, workers = {}".format(len(file_names), engine_name, workers))
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(solve_file, file_name, engine_name): file_name for file_name in file_names}
+        for future in as_completed(futures):
+            try:
+                max_length, max_drop, elapsed = future.result()
+            except Exception as e:
+                print("{}, error = {}".format(futures[future], e), flush=True)
+                continue
+            print("{}, max length = {}, drop = {}, time = {:.3f} s".
+                  format(futures[future], max_length, max_drop, elapsed), flush=True)
+
+    logging.info("Batch: {} maps solved in {:.3f} s".format(len(file_names), time.perf_counter() - start))
 
-        # 4. West
-        if area.y == 0:  # there's no neighbour to the West of current area -> the base case
-            area.update_parameters(1, area.height)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the longest (and then steepest) path on a ski map.")
+    parser.add_argument("map_file", nargs="?", default="map.txt", help="the input map (default: map.txt)")
+    parser.add_argument("--engine", choices=solvers, default=engine, help="the engine to solve the map")
+    parser.add_argument("--cache", action="store_true", default=b_cache, help="cache the parsed map in binary")
+    parser.add_argument("--path", action="store_true", help="print the longest (and then steepest) path")
+    parser.add_argument("--start", nargs=2, type=int, action="append", default=[], metavar=("X", "Y"),
+                        help="print the path starting from Area (X, Y), can be repeated")
+    parser.add_argument("--edit", nargs=3, type=int, action="append", default=[], metavar=("X", "Y", "HEIGHT"),
+                        help="change the height of Area (X, Y) after solving and update the results, "
+                             "can be repeated")
+    parser.add_argument("--work-dir", help="the directory of the memory-mapped files of the mmap engine "
+                                           "(default: the input map + '.mmap')")
+    parser.add_argument("--workers", type=int, default=num_workers,
+                        help="the number of worker processes of the tiled engine and the batch mode "
+                             "(default: number of CPUs)")
+    parser.add_argument("--tile-size", type=int, default=tile_size,
+                        help="the size of the tiles of the tiled engine (default: {})".format(tile_size))
+    parser.add_argument("--batch", metavar="PATTERN",
+                        help="solve all the maps in a directory or matching a glob pattern in parallel processes "
+                             "(see --workers), instead of the input map")
+    parser.add_argument("--save-results", metavar="DIR", help="save the length and drop of every Area to DIR")
+    parser.add_argument("--results", metavar="DIR",
+                        help="answer the queries below from the results saved in DIR, without solving the map")
+    parser.add_argument("--top", type=int, metavar="K", help="query: the best K start Areas")
+    parser.add_argument("--region", nargs=4, type=int, metavar=("X1", "Y1", "X2", "Y2"),
+                        help="query: the best start Area within the region from (X1, Y1) to (X2, Y2)")
+    parser.add_argument("--lookup", nargs=2, type=int, action="append", default=[], metavar=("X", "Y"),
+                        help="query: the length and drop of Area (X, Y), can be repeated")
+    args = parser.parse_args()
+
+    if args.results:
+        query_results(args)
+        return
+
+    if args.batch:
+        solve_batch(args.batch, args.workers, args.engine)
+        return
+
+    # ski_map keeps the heights, path lengths and bottom heights of all the Areas in typed arrays
+    if args.engine == "mmap":
+        work_dir = args.work_dir or args.map_file + ".mmap"
+        ski_map = prepare_map_out_of_core(args.map_file, work_dir)
+        solve_out_of_core(ski_map, work_dir)
+    else:
+        ski_map = prepare_map(args.map_file, args.cache)
+
+        if args.engine == "tiled":
+            solve_tiled(ski_map, args.workers, args.tile_size)
         else:
-            neighbour = ski_map[area.x][area.y - 1]
-            compare_with_neighbour(area, neighbour)
+            solvers[args.engine](ski_map)
 
-        # all neighbours have been visited, the current area has been updated/visited as well
-        area.b_visited = True
-
-        return area.height - area.bottom_height
-
-    # ski_map is a list of lists with size row x column, where each entry is an Area
-    # the indexes of each Area in ski_map is their location on the map
-    ski_map, row, column = prepare_map("map.txt")
-
-    # the minimum of max_length should be '1' and max_drop should be '0'
-    # init both to negative values and update them accordingly
-    max_length = -1
-    max_drop = -1  # the max_drop is not the maximum drop on the map, it's the drop of the path with max_length
-
-    for i in range(row):
-        for j in range(column):
-            area = ski_map[i][j]
-            drop = visit_area(area)
-            if max_length < area.path_length:
-                logging.debug(area)
-                max_length = area.path_length
-                max_drop = drop
-            elif max_length == area.path_length:
-                # break tie with larger drop
-                logging.debug(area)
-                max_drop = max(drop, max_drop)
+    max_length, max_drop = find_max_path(ski_map)
 
     print("Results: max length = {}, drop = {}".format(max_length, max_drop))
 
+    if args.edit:
+        max_length, max_drop = update_heights(ski_map, args.edit)
+        print("Results after {} edits: max length = {}, drop = {}".format(len(args.edit), max_length, max_drop))
 
-if __name__ == "__main__":
-    main()
+    if args.save_results:
+        save_results(ski_map, args.save_results)
+
+    if args.path:
+        print_path(ski_map, *ski_map.best_start())
 
+    for x, y in args.start:
+        if not (0 <= x < ski_map.row and 0 <= y < ski_map.column):
+            raise Exception("Area({}, {}) is not on the map".format(x, y))
+        print_path(ski_map, x, y)
 
 
+if __name__ == "__main__":
+    main()